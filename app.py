@@ -2,18 +2,71 @@ import gradio as gr
 import os
 from pdf2docx import Converter
 from docx import Document
-from docx.table import _Cell
+from docx.table import Table, _Cell
+from docx.blkcntnr import BlockItemContainer
+from docx.oxml.table import CT_Tbl
+from docx.parts.styles import StylesPart
+from docx.parts.numbering import NumberingPart
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from docx.oxml import OxmlElement
+from docx.enum.style import WD_STYLE_TYPE
 from docx.shared import Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_COLOR_INDEX
-from docx.oxml.ns import qn
+from docx.enum.dml import MSO_THEME_COLOR
+from docx.oxml.ns import nsmap, qn
+from docx.oxml.simpletypes import ST_HpsMeasure
+from docx.parts.hdrftr import HeaderPart, FooterPart
+from docx.styles import BabelFish
+from lxml import etree
 import json
 import base64
+import copy
+import difflib
+import io
+import re
+import shutil
 import hashlib
 import sys
 import tempfile
-from flask import Flask, request, jsonify, send_file
+import zipfile
+import posixpath
+import queue
+from collections import OrderedDict
+from flask import Flask, Request, Response, request, jsonify, send_file
 import threading
 import secrets
+import time
+
+# Optional serializers: MessagePack/CBOR bodies and the orjson fast path are only
+# offered when their library is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+# Optional incremental JSON parser for large JSON->DOCX payloads
+try:
+    import ijson
+except ImportError:
+    ijson = None
+# Optional response compression codecs (gzip is always available through zlib)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+import zlib
 
 # Generate a random API key if one doesn't exist in environment variables
 API_KEY = os.environ.get('API_KEY', 'docgen_api_12345')
@@ -116,62 +169,278 @@ def get_preview(file_path):
     except Exception as e:
         return f"<b>Error generating preview:</b> {e}"
 
-def extract_runs(paragraph):
-    runs = []
-    for run in paragraph.runs:
-        run_data = {
-            "text": run.text
-        }
-        if run.bold:
-            run_data["bold"] = True
-        if run.italic:
-            run_data["italic"] = True
-        if run.underline:
-            run_data["underline"] = True
-        if run.font and run.font.size:
-            run_data["font_size"] = run.font.size.pt
-        if run.font and run.font.name:
-            run_data["font_name"] = run.font.name
-        # Extract color (RGB or theme)
-        if run.font and run.font.color:
-            if run.font.color.rgb:
-                run_data["color"] = str(run.font.color.rgb)
-            elif run.font.color.theme_color:
-                run_data["color_theme"] = str(run.font.color.theme_color)
-        # Highlight color
-        if run.font and hasattr(run.font, "highlight_color") and run.font.highlight_color:
-            run_data["highlight"] = str(run.font.highlight_color)
-        # Strikethrough
-        if run.font and run.font.strike:
-            run_data["strikethrough"] = True
-        # Superscript/subscript
-        if run.font and run.font.superscript:
-            run_data["superscript"] = True
-        if run.font and run.font.subscript:
-            run_data["subscript"] = True
-        # Small caps
-        if run.font and run.font.small_caps:
-            run_data["small_caps"] = True
-        # All caps
-        if run.font and run.font.all_caps:
-            run_data["all_caps"] = True
-        # Add hyperlink detection (if run is part of a hyperlink)
-        if run._element.xpath("ancestor::w:hyperlink"):
-            # Try to extract hyperlink target if possible
-            parent_hyper = run._element.xpath("ancestor::w:hyperlink")[0]
-            rId = parent_hyper.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id')
+# WordprocessingML tag and attribute names used by the extractors
+W_BODY = qn("w:body")
+W_P = qn("w:p")
+W_R = qn("w:r")
+W_TBL = qn("w:tbl")
+W_TR = qn("w:tr")
+W_TC = qn("w:tc")
+W_T = qn("w:t")
+W_BR = qn("w:br")
+W_PPR = qn("w:pPr")
+W_RPR = qn("w:rPr")
+W_TCPR = qn("w:tcPr")
+W_TRPR = qn("w:trPr")
+W_SECTPR = qn("w:sectPr")
+W_HYPERLINK = qn("w:hyperlink")
+W_SDT = qn("w:sdt")
+W_SDT_CONTENT = qn("w:sdtContent")
+W_NUMPR = qn("w:numPr")
+W_BOOKMARK_START = qn("w:bookmarkStart")
+W_COMMENT_RANGE_START = qn("w:commentRangeStart")
+# python-docx has no "mc" prefix. Word writes text boxes and other DrawingML content as
+# mc:AlternateContent with an mc:Choice and a VML mc:Fallback copy of the same content
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+W_GRID_SPAN = qn("w:gridSpan")
+W_VMERGE = qn("w:vMerge")
+W_GRID_BEFORE = qn("w:gridBefore")
+W_TCW = qn("w:tcW")
+W_SHD = qn("w:shd")
+W_B = qn("w:b")
+W_I = qn("w:i")
+W_U = qn("w:u")
+W_SZ = qn("w:sz")
+W_RFONTS = qn("w:rFonts")
+W_COLOR = qn("w:color")
+W_HIGHLIGHT = qn("w:highlight")
+W_STRIKE = qn("w:strike")
+W_VERT_ALIGN = qn("w:vertAlign")
+W_SMALL_CAPS = qn("w:smallCaps")
+W_CAPS = qn("w:caps")
+W_VAL = qn("w:val")
+W_TYPE = qn("w:type")
+W_ASCII = qn("w:ascii")
+W_THEME_COLOR = qn("w:themeColor")
+W_W = qn("w:w")
+W_FILL = qn("w:fill")
+R_ID = qn("r:id")
+
+def get_hyperlink_targets(part):
+    """Map every w:r inside a w:hyperlink of `part` to the hyperlink's resolved target.
+
+    Built with one walk over the part the first time it is needed and kept on the
+    part, so each run's hyperlink is a dict lookup instead of an ancestor scan.
+    """
+    targets = getattr(part, '_hyperlink_targets', None)
+    if targets is None:
+        targets = {}
+        for hyperlink in part.element.iter(W_HYPERLINK):
+            target = None
+            rId = hyperlink.get(R_ID)
             if rId:
                 try:
-                    rel = paragraph.part.rels[rId]
-                    run_data["hyperlink"] = rel.target_ref
+                    target = part.rels[rId].target_ref
                 except Exception:
                     pass
+            # Document order visits outer hyperlinks first, so the outermost one wins
+            for r in hyperlink.iter(W_R):
+                targets.setdefault(r, target)
+        part._hyperlink_targets = targets
+    return targets
+
+# --- Field projection ---
+# fields=text,type,level or fields=runs.bold restricts the output to the named keys.
+# A projection is a dict of frozensets per level ("block", "run", "cell"); None means
+# every field. Extraction checks it before computing a property, so colors,
+# hyperlink targets, cell widths etc. are skipped when nobody asked for them.
+BLOCK_FIELDS = frozenset(["type", "level", "list_type", "runs", "alignment", "style",
+                          "page_break", "bookmarks", "comments", "rows"])
+RUN_FIELDS = frozenset(["text", "bold", "italic", "underline", "font_size", "font_name", "color",
+                        "color_theme", "highlight", "strikethrough", "superscript", "subscript",
+                        "small_caps", "all_caps", "hyperlink"])
+CELL_FIELDS = frozenset(["blocks", "colspan", "rowspan", "width", "shading"])
+RUN_FORMAT_FIELDS = RUN_FIELDS - {"text", "hyperlink"}
+PARAGRAPH_FEATURE_FIELDS = frozenset(["type", "list_type", "page_break", "bookmarks", "comments"])
+FIELD_PREFIXES = {"runs": "run", "rows": "cell", "cells": "cell"}
+
+def parse_fields(spec):
+    """Parse a fields= projection. Returns (projection or None, error message)."""
+    if not spec:
+        return None, None
+    projection = {"block": set(), "run": set(), "cell": set()}
+    for name in (n.strip() for n in spec.split(",")):
+        if not name:
+            continue
+        prefix, _, field = name.rpartition(".")
+        if prefix:
+            level = FIELD_PREFIXES.get(prefix)
+            known = {"run": RUN_FIELDS, "cell": CELL_FIELDS}.get(level, ())
+            if field not in known:
+                return None, f"Unknown field '{name}'"
+            projection[level].add(field)
+        elif field in BLOCK_FIELDS or field in RUN_FIELDS or field in CELL_FIELDS:
+            # A bare name applies at every level that has it
+            for level, known in (("block", BLOCK_FIELDS), ("run", RUN_FIELDS), ("cell", CELL_FIELDS)):
+                if field in known:
+                    projection[level].add(field)
+        else:
+            return None, f"Unknown field '{name}'"
+    # "runs" alone means whole runs; run fields imply the runs list. Table rows and
+    # cell blocks are structure and always kept.
+    if "runs" in projection["block"] and not projection["run"]:
+        projection["run"] = set(RUN_FIELDS)
+    if projection["run"]:
+        projection["block"].add("runs")
+    projection["block"].add("rows")
+    projection["cell"].add("blocks")
+    return {level: frozenset(names) for level, names in projection.items()}, None
+
+def wants(fields, *keys):
+    # True when a projection level (None = every field) asks for any of `keys`
+    return fields is None or not fields.isdisjoint(keys)
+
+def project(data, fields):
+    return data if fields is None else {k: v for k, v in data.items() if k in fields}
+
+def extract_run_formatting(run, fields=None):
+    formatting = {}
+    if wants(fields, "bold") and run.bold:
+        formatting["bold"] = True
+    if wants(fields, "italic") and run.italic:
+        formatting["italic"] = True
+    if wants(fields, "underline") and run.underline:
+        formatting["underline"] = True
+    if wants(fields, "font_size") and run.font and run.font.size:
+        formatting["font_size"] = run.font.size.pt
+    if wants(fields, "font_name") and run.font and run.font.name:
+        formatting["font_name"] = run.font.name
+    # Extract color (RGB or theme)
+    if wants(fields, "color", "color_theme") and run.font and run.font.color:
+        if run.font.color.rgb:
+            formatting["color"] = str(run.font.color.rgb)
+        elif run.font.color.theme_color:
+            formatting["color_theme"] = str(run.font.color.theme_color)
+    # Highlight color
+    if wants(fields, "highlight") and run.font and hasattr(run.font, "highlight_color") and run.font.highlight_color:
+        formatting["highlight"] = str(run.font.highlight_color)
+    # Strikethrough
+    if wants(fields, "strikethrough") and run.font and run.font.strike:
+        formatting["strikethrough"] = True
+    # Superscript/subscript
+    if wants(fields, "superscript") and run.font and run.font.superscript:
+        formatting["superscript"] = True
+    if wants(fields, "subscript") and run.font and run.font.subscript:
+        formatting["subscript"] = True
+    # Small caps
+    if wants(fields, "small_caps") and run.font and run.font.small_caps:
+        formatting["small_caps"] = True
+    # All caps
+    if wants(fields, "all_caps") and run.font and run.font.all_caps:
+        formatting["all_caps"] = True
+    return project(formatting, fields)
+
+def rpr_signature(rPr):
+    # Canonical form of a w:rPr: each property element's tag with its attributes in
+    # sorted order. Every value extract_run_formatting reads lives on these elements.
+    if rPr is None:
+        return None
+    return tuple((child.tag, tuple(sorted(child.items()))) for child in rPr)
+
+def get_run_format_cache(part):
+    # One cache per document, shared by the body and header/footer parts
+    package = part.package
+    cache = getattr(package, '_run_format_cache', None)
+    if cache is None:
+        cache = package._run_format_cache = {}
+    return cache
+
+def iter_paragraph_runs(paragraph):
+    # The paragraph's runs in document order, including runs inside w:hyperlink, which
+    # paragraph.runs leaves out
+    for child in paragraph._p.iterchildren(W_R, W_HYPERLINK):
+        if child.tag == W_R:
+            yield Run(child, paragraph)
+        else:
+            for r in child.iterchildren(W_R):
+                yield Run(r, paragraph)
+
+def extract_runs(paragraph, style_name=None, fields=None):
+    runs = []
+    run_fields = fields["run"] if fields else None
+    hyperlink_targets = get_hyperlink_targets(paragraph.part) if wants(run_fields, "hyperlink") else {}
+    formatted = wants(run_fields, *RUN_FORMAT_FIELDS)
+    format_cache = get_run_format_cache(paragraph.part)
+    if style_name is None and formatted:
+        style_name = paragraph.style.name if paragraph.style else "Normal"
+    for run in iter_paragraph_runs(paragraph):
+        run_data = {"text": run.text} if wants(run_fields, "text") else {}
+        if formatted:
+            # Each distinct formatting is resolved through python-docx once per document
+            key = (style_name, rpr_signature(run._element.rPr), run_fields)
+            formatting = format_cache.get(key)
+            if formatting is None:
+                formatting = format_cache[key] = extract_run_formatting(run, run_fields)
+            run_data.update(formatting)
+        # Add hyperlink detection (if run is part of a hyperlink)
+        hyperlink = hyperlink_targets.get(run._element)
+        if hyperlink is not None:
+            run_data["hyperlink"] = hyperlink
         runs.append(run_data)
     return runs
 
+def coalescing(options):
+    # Run coalescing is on unless runs=split was asked for
+    return not options or options.get("runs") != "split"
+
+def coalesce_runs(runs):
+    """Merge adjacent runs whose properties other than text are equal.
+
+    Word splits text into many runs for rsid revision tracking; after extraction
+    those runs usually carry identical formatting dicts.
+    """
+    merged = []
+    for run in runs:
+        if merged and "text" in run:
+            last = merged[-1]
+            if len(last) == len(run) and all(k == "text" or last.get(k, run) == v for k, v in run.items()):
+                last["text"] += run["text"]
+                continue
+        merged.append(run)
+    return merged
+
+def in_fallback(el, stop=None):
+    # True if el lies inside an mc:Fallback below `stop`, i.e. in the duplicate copy of
+    # an mc:Choice that Word only reads when it cannot handle the choice
+    for ancestor in el.iterancestors():
+        if ancestor is stop:
+            return False
+        if ancestor.tag == MC_FALLBACK:
+            return True
+    return False
+
+def scan_paragraph_features(p):
+    """Collect the paragraph-level features of a w:p in a single walk over its descendants.
+
+    Replaces separate .//w:numPr, .//w:br[@w:type='page'], .//w:bookmarkStart and
+    .//w:commentRangeStart queries, each of which traversed the whole subtree.
+    Text-box content in mc:Fallback is skipped, so it is not counted twice.
+    """
+    features = {"numbered": False, "page_break": False, "bookmarks": [], "comments": False}
+    for el in p.iter(W_NUMPR, W_BR, W_BOOKMARK_START, W_COMMENT_RANGE_START):
+        if in_fallback(el, p):
+            continue
+        tag = el.tag
+        if tag == W_BR:
+            if el.get(W_TYPE) == "page":
+                features["page_break"] = True
+        elif tag == W_BOOKMARK_START:
+            features["bookmarks"].append(el)
+        elif tag == W_NUMPR:
+            features["numbered"] = True
+        else:
+            features["comments"] = True
+    return features
+
 # Detect heading and list paragraphs
-def extract_paragraph_block(paragraph):
+def extract_paragraph_block(paragraph, options=None):
+    fields = options.get("fields") if options else None
+    block_fields = fields["block"] if fields else None
     style_name = paragraph.style.name if paragraph.style else "Normal"
+    if wants(block_fields, *PARAGRAPH_FEATURE_FIELDS):
+        features = scan_paragraph_features(paragraph._element)
+    else:
+        features = {"numbered": False, "page_break": False, "bookmarks": [], "comments": False}
     # Heading
     if style_name.startswith("Heading"):
         try:
@@ -181,41 +450,41 @@ def extract_paragraph_block(paragraph):
         block = {
             "type": "heading",
             "level": level,
-            "runs": extract_runs(paragraph),
-            "alignment": str(paragraph.alignment) if paragraph.alignment else "left",
-            "style": style_name
         }
     # List
-    elif "List" in style_name or paragraph._element.xpath(".//w:numPr"):
+    elif "List" in style_name or features["numbered"]:
         block = {
             "type": "list_item",
             "list_type": "number" if "Number" in style_name else "bullet",
-            "runs": extract_runs(paragraph),
-            "alignment": str(paragraph.alignment) if paragraph.alignment else "left",
-            "style": style_name
         }
     # Normal paragraph
     else:
         block = {
             "type": "paragraph",
-            "runs": extract_runs(paragraph),
-            "alignment": str(paragraph.alignment) if paragraph.alignment else "left",
-            "style": style_name
         }
+    if wants(block_fields, "runs"):
+        runs = extract_runs(paragraph, style_name, fields)
+        block["runs"] = coalesce_runs(runs) if coalescing(options) else runs
+    if wants(block_fields, "alignment"):
+        block["alignment"] = str(paragraph.alignment) if paragraph.alignment else "left"
+    block["style"] = style_name
     # Page break
-    if paragraph._element.xpath(".//w:br[@w:type='page']"):
+    if features["page_break"]:
         block["page_break"] = True
     # Bookmarks
-    bookmarks = paragraph._element.xpath(".//w:bookmarkStart")
+    bookmarks = features["bookmarks"]
     if bookmarks:
         block["bookmarks"] = [bm.get("w:name") for bm in bookmarks if bm.get("w:name")]
     # Comments (commentRangeStart)
-    comments = paragraph._element.xpath(".//w:commentRangeStart")
-    if comments:
+    if features["comments"]:
         block["comments"] = True
-    return block
+    return project(block, block_fields)
 
-def extract_table_block(table):
+def extract_table_block(table, options=None):
+    fields = options.get("fields") if options else None
+    if options and options.get("tables") == "spans":
+        return extract_table_spans(table._tbl, lambda p: extract_paragraph_block(Paragraph(p, table), options), fields)
+    cell_fields = fields["cell"] if fields else None
     rows = []
     for row in table.rows:
         row_cells = []
@@ -228,89 +497,397 @@ def extract_table_block(table):
                 if para_id not in seen:
                     unique_paras.append(para)
                     seen.add(para_id)
-            cell_blocks = [extract_paragraph_block(para) for para in unique_paras if para.text.strip()]
+            cell_blocks = [extract_paragraph_block(para, options) for para in unique_paras if para.text.strip()]
             # Cell properties: merge, width, shading
             cell_props = {}
             tc = cell._tc
-            gridspan = tc.xpath(".//w:gridSpan")
+            gridspan = tc.xpath(".//w:gridSpan") if wants(cell_fields, "colspan") else None
             if gridspan:
                 cell_props["colspan"] = int(gridspan[0].get("w:val", "1"))
-            vmerge = tc.xpath(".//w:vMerge")
+            vmerge = tc.xpath(".//w:vMerge") if wants(cell_fields, "rowspan") else None
             if vmerge:
                 cell_props["rowspan"] = True
-            width = tc.xpath(".//w:tcW")
+            width = tc.xpath(".//w:tcW") if wants(cell_fields, "width") else None
             if width:
                 cell_props["width"] = int(width[0].get("w:w", "0"))
-            shading = tc.xpath(".//w:shd")
+            shading = tc.xpath(".//w:shd") if wants(cell_fields, "shading") else None
             if shading:
                 cell_props["shading"] = shading[0].get("w:fill")
             row_cells.append({"blocks": cell_blocks, **cell_props})
         rows.append(row_cells)
-    return {"type": "table", "rows": rows}
+    return project({"type": "table", "rows": rows}, fields["block"] if fields else None)
+
+def _tc_merge_props(tc):
+    # (tcPr, grid span, vMerge value) of a w:tc, read from its direct properties
+    tcPr = tc.find(W_TCPR)
+    if tcPr is None:
+        return None, 1, None
+    gridspan = tcPr.find(W_GRID_SPAN)
+    vmerge = tcPr.find(W_VMERGE)
+    span = int(gridspan.get(W_VAL)) if gridspan is not None else 1
+    return tcPr, span, vmerge.get(W_VAL, "continue") if vmerge is not None else None
+
+def _tr_grid_before(tr):
+    trPr = tr.find(W_TRPR)
+    grid_before = trPr.find(W_GRID_BEFORE) if trPr is not None else None
+    return int(grid_before.get(W_VAL)) if grid_before is not None else 0
+
+def extract_table_spans(tbl, extract_paragraph, fields=None):
+    """Walk w:tr/w:tc directly and emit each cell once with its real column and row span.
+
+    Unlike extract_table_block, spanned cells are not repeated: colspan comes from
+    w:gridSpan, rowspan counts the rows joined by vMerge restart/continue, and the
+    continuation cells themselves are left out. Runs in time linear in the number of cells.
+    """
+    cell_fields = fields["cell"] if fields else None
+    rows = []
+    open_merges = {}  # grid offset -> cell whose vertical merge is still open
+    for tr in tbl.iterchildren(W_TR):
+        offset = _tr_grid_before(tr)
+        row_cells = []
+        next_merges = {}
+        for tc in tr.iterchildren(W_TC):
+            tcPr, span, vmerge = _tc_merge_props(tc)
+            if vmerge == "continue" and offset in open_merges:
+                cell = open_merges[offset]
+                cell["rowspan"] += 1
+                next_merges[offset] = cell
+                offset += span
+                continue
+            cell = {"blocks": [extract_paragraph(p) for p in tc.iterchildren(W_P) if stream_paragraph_text(p).strip()]}
+            if span > 1:
+                cell["colspan"] = span
+            if vmerge == "restart":
+                cell["rowspan"] = 1
+                next_merges[offset] = cell
+            if tcPr is not None:
+                width = tcPr.find(W_TCW) if wants(cell_fields, "width") else None
+                if width is not None and width.get(W_W) is not None:
+                    cell["width"] = int(width.get(W_W))
+                shading = tcPr.find(W_SHD) if wants(cell_fields, "shading") else None
+                if shading is not None and shading.get(W_FILL):
+                    cell["shading"] = shading.get(W_FILL)
+            row_cells.append(cell)
+            offset += span
+        rows.append(row_cells)
+        open_merges = next_merges
+    if cell_fields is not None:
+        # Spans are needed to walk the grid, so they are dropped only afterwards
+        rows = [[project(cell, cell_fields) for cell in row_cells] for row_cells in rows]
+    return project({"type": "table", "rows": rows}, fields["block"] if fields else None)
+
+# --- Content-addressed image store ---
+# Extracted images are written once under the SHA-256 of their bytes, so the same
+# logo in every document is stored a single time. Least recently used files are
+# evicted once the store grows past IMAGE_STORE_MAX_BYTES.
+REL_IMAGE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+IMAGE_STORE_DIR = os.environ.get('IMAGE_STORE_DIR', os.path.join(tempfile.gettempdir(), 'docgen_images'))
+IMAGE_STORE_MAX_BYTES = int(os.environ.get('IMAGE_STORE_MAX_BYTES', 512 * 1024 * 1024))
+_image_store_lock = threading.Lock()
+_image_store_index = None  # file name -> size, least recently used first
+_image_store_bytes = 0
 
-def extract_images_from_doc(doc, output_dir, image_prefix):
+def load_file_lru(directory):
+    """Index the files of a cache directory by modification time: name -> size, least recently used first."""
+    os.makedirs(directory, exist_ok=True)
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.tmp'):
+            continue
+        st = os.stat(os.path.join(directory, name))
+        entries.append((st.st_mtime, name, st.st_size))
+    return OrderedDict((name, size) for _, name, size in sorted(entries))
+
+def pick_file_lru_victims(index, total_bytes, max_bytes):
+    # Drop least recently used entries from the index until it fits max_bytes; returns
+    # (names to remove, new total) so the files can be unlinked outside the index lock
+    victims = []
+    while total_bytes > max_bytes and len(index) > 1:
+        name, size = index.popitem(last=False)
+        total_bytes -= size
+        victims.append(name)
+    return victims, total_bytes
+
+def remove_files(directory, names):
+    for name in names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+def evict_file_lru(directory, index, total_bytes, max_bytes):
+    # Remove least recently used files until the directory fits max_bytes; returns the new total
+    victims, total_bytes = pick_file_lru_victims(index, total_bytes, max_bytes)
+    remove_files(directory, victims)
+    return total_bytes
+
+def _load_image_store_index():
+    # Rebuild the LRU order from file modification times the first time the store is used
+    global _image_store_index, _image_store_bytes
+    if _image_store_index is None:
+        _image_store_index = load_file_lru(IMAGE_STORE_DIR)
+        _image_store_bytes = sum(_image_store_index.values())
+        _evict_images(_image_store_index)
+    return _image_store_index
+
+def _evict_images(index):
+    global _image_store_bytes
+    _image_store_bytes = evict_file_lru(IMAGE_STORE_DIR, index, _image_store_bytes, IMAGE_STORE_MAX_BYTES)
+
+def store_image(blob, ext):
+    """Write an image to the content-addressed store unless it is already there.
+
+    Returns (sha256 hex digest, file name inside IMAGE_STORE_DIR).
+    """
+    global _image_store_bytes
+    digest = hashlib.sha256(blob).hexdigest()
+    filename = f"{digest}.{ext}"
+    path = os.path.join(IMAGE_STORE_DIR, filename)
+    with _image_store_lock:
+        index = _load_image_store_index()
+        if filename in index and os.path.exists(path):
+            index.move_to_end(filename)
+            os.utime(path)
+            return digest, filename
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        _image_store_bytes += len(blob) - index.pop(filename, 0)
+        index[filename] = len(blob)
+        _evict_images(index)
+    return digest, filename
+
+def image_block(image_prefix, blob, content_type):
+    img_ext = content_type.split('/')[-1]
+    img_hash, img_filename = store_image(blob, img_ext)
+    return {
+        "type": "image",
+        "image_id": f"{image_prefix}_{img_hash[:8]}",
+        "image_format": img_ext,
+        "path": img_filename
+    }
+
+def extract_images_from_doc(doc, image_prefix):
     image_blocks = []
     rels = doc.part.rels
     for rel in rels.values():
-        if rel.reltype == 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image':
-            img_blob = rel.target_part.blob
-            img_hash = hashlib.sha1(img_blob).hexdigest()[:8]
-            img_ext = rel.target_part.content_type.split('/')[-1]
-            img_id = f"{image_prefix}_{img_hash}"
-            img_filename = f"{img_id}.{img_ext}"
-            img_path = os.path.join(output_dir, img_filename)
-            with open(img_path, 'wb') as f:
-                f.write(img_blob)
-            image_blocks.append({
-                "type": "image",
-                "image_id": img_id,
-                "image_format": img_ext,
-                "path": img_filename
-            })
+        if rel.reltype == REL_IMAGE and not rel.is_external:
+            image_blocks.append(image_block(image_prefix, rel.target_part.blob, rel.target_part.content_type))
     return image_blocks
 
-def add_runs_to_paragraph(paragraph, runs):
+# --- Compact schema ---
+# schema=compact stores each distinct run formatting and paragraph style once in a
+# top-level "styles" table. A run becomes its text (no formatting) or [text, index],
+# and a paragraph's style/alignment pair becomes an integer "style" index.
+SCHEMAS = ("full", "compact")
+
+def compact_result(result):
+    """Rewrite a full-schema result into the compact schema. `result` is not modified."""
+    styles = []
+    index = {}
+
+    def intern(entry):
+        key = tuple(sorted(entry.items()))
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(styles)
+            styles.append(entry)
+        return i
+
+    def compact_run(run):
+        formatting = {k: v for k, v in run.items() if k != "text"}
+        if not formatting and "text" in run:
+            return run["text"]
+        return [run.get("text"), intern(formatting)]
+
+    def compact_block(block):
+        block = dict(block)
+        if "runs" in block:
+            block["runs"] = [compact_run(run) for run in block["runs"]]
+        if "style" in block:
+            paragraph_style = {"style": block.pop("style")}
+            if "alignment" in block:
+                paragraph_style["alignment"] = block.pop("alignment")
+            block["style"] = intern(paragraph_style)
+        if "rows" in block:
+            block["rows"] = [[dict(cell, blocks=compact_blocks(cell["blocks"])) for cell in row] for row in block["rows"]]
+        return block
+
+    def compact_blocks(blocks):
+        # same_as header/footer references pass through unchanged
+        return [compact_block(block) for block in blocks] if isinstance(blocks, list) else blocks
+
+    compact = {"schema": "compact", "styles": styles}
+    for key, value in result.items():
+        if key == "body":
+            compact[key] = compact_blocks(value)
+        elif key == "sections":
+            compact[key] = [{htype: compact_blocks(blocks) for htype, blocks in sec.items()} for sec in value]
+        else:
+            compact[key] = value
+    return compact
+
+def expand_run(run, styles):
+    # A compact run (text or [text, style index]) as a full run dict; full runs pass through
+    if isinstance(run, str):
+        return {"text": run}
+    if isinstance(run, list):
+        text, i = run
+        run_info = {} if text is None else {"text": text}
+        run_info.update(styles[i])
+        return run_info
+    return run
+
+def expand_blocks(blocks, styles):
+    if not isinstance(blocks, list):
+        return
+    for block in blocks:
+        if not isinstance(block, dict):
+            continue
+        if "runs" in block:
+            block["runs"] = [expand_run(run, styles) for run in block["runs"]]
+        if isinstance(block.get("style"), int):
+            block.update(styles[block["style"]])
+        for row in block.get("rows", []):
+            for cell in row:
+                expand_blocks(cell.get("blocks"), styles)
+
+def expand_compact(data):
+    """Rewrite a compact-schema document into the full schema, in place."""
+    if data.get("schema") != "compact":
+        return data
+    styles = data.pop("styles", [])
+    data.pop("schema")
+    expand_blocks(data.get("body"), styles)
+    expand_blocks(data.get("blocks"), styles)
+    for sec in data.get("sections") or []:
+        if isinstance(sec, dict):
+            for blocks in sec.values():
+                expand_blocks(blocks, styles)
+    return data
+
+def add_runs_to_paragraph(paragraph, runs, styles=None):
     for run_info in runs:
+        # Compact-schema runs are resolved against their styles table
+        run_info = expand_run(run_info, styles)
         run = paragraph.add_run(run_info.get("text", ""))
-        if run_info.get("bold"): run.bold = True
-        if run_info.get("italic"): run.italic = True
-        if run_info.get("underline"): run.underline = True
-        if run_info.get("font_size"): run.font.size = Pt(run_info["font_size"])
-        if run_info.get("font_name"): run.font.name = run_info["font_name"]
-        # Set color (RGB or theme)
-        if run_info.get("color"):
-            try:
-                run.font.color.rgb = RGBColor.from_string(run_info["color"].replace("#", ""))
-            except Exception:
-                pass
-        elif run_info.get("color_theme"):
-            try:
-                run.font.color.theme_color = int(run_info["color_theme"])
-            except Exception:
-                pass
-        if run_info.get("highlight"):
-            try:
-                if run_info["highlight"].isdigit():
-                    run.font.highlight_color = int(run_info["highlight"])
-                else:
-                    run.font.highlight_color = WD_COLOR_INDEX[run_info["highlight"]]
-            except Exception:
-                pass
-        # Strikethrough
-        if run_info.get("strikethrough"): run.font.strike = True
-        # Superscript/subscript
-        if run_info.get("superscript"): run.font.superscript = True
-        if run_info.get("subscript"): run.font.subscript = True
-        # Small caps
-        if run_info.get("small_caps"): run.font.small_caps = True
-        # All caps
-        if run_info.get("all_caps"): run.font.all_caps = True
-        # Hyperlink
-        if run_info.get("hyperlink"):
-            try:
-                run.hyperlink = run_info["hyperlink"]
-            except Exception:
-                pass
+        # Formatting is copied from a w:rPr prebuilt for it, not set property by property
+        rPr = rpr_template(run_info)
+        if rPr is not None:
+            run._r.insert(0, copy.deepcopy(rPr))
+
+# --- Run-property templates ---
+# Runs with the same formatting get the same w:rPr. It is built once per distinct
+# formatting, by applying the formatting to a scratch run, and then deep-copied into
+# every run that uses it. Templates don't depend on the document, so they are kept for
+# the life of the process, up to RPR_TEMPLATES_MAX distinct formattings.
+RUN_FORMAT_KEYS = ("bold", "italic", "underline", "font_size", "font_name", "color", "color_theme",
+                   "highlight", "strikethrough", "superscript", "subscript", "small_caps", "all_caps")
+RPR_TEMPLATES_MAX = int(os.environ.get('RPR_TEMPLATES_MAX', 4096))
+_rpr_templates = {}
+
+def rpr_template(run_info):
+    # The w:rPr python-docx gives a run with this formatting, or None when it adds none
+    # Values are keyed with their type, since e.g. True == 1 but font_name=True writes "True"
+    key = tuple((value, type(value)) for value in map(run_info.get, RUN_FORMAT_KEYS))
+    try:
+        return _rpr_templates[key]
+    except KeyError:
+        pass
+    except TypeError:
+        key = None  # unhashable values are formatted every time
+    run = Run(OxmlElement("w:r"), None)
+    apply_run_formatting(run, run_info)
+    template = run._r.rPr
+    if key is not None and len(_rpr_templates) < RPR_TEMPLATES_MAX:
+        _rpr_templates[key] = template
+    return template
+
+def apply_run_formatting(run, run_info):
+    if run_info.get("bold"): run.bold = True
+    if run_info.get("italic"): run.italic = True
+    if run_info.get("underline"): run.underline = True
+    if run_info.get("font_size"): run.font.size = Pt(run_info["font_size"])
+    if run_info.get("font_name"): run.font.name = run_info["font_name"]
+    # Set color (RGB or theme)
+    if run_info.get("color"):
+        try:
+            run.font.color.rgb = RGBColor.from_string(run_info["color"].replace("#", ""))
+        except Exception:
+            pass
+    elif run_info.get("color_theme"):
+        try:
+            run.font.color.theme_color = int(run_info["color_theme"])
+        except Exception:
+            pass
+    if run_info.get("highlight"):
+        try:
+            if run_info["highlight"].isdigit():
+                run.font.highlight_color = int(run_info["highlight"])
+            else:
+                run.font.highlight_color = WD_COLOR_INDEX[run_info["highlight"]]
+        except Exception:
+            pass
+    # Strikethrough
+    if run_info.get("strikethrough"): run.font.strike = True
+    # Superscript/subscript
+    if run_info.get("superscript"): run.font.superscript = True
+    if run_info.get("subscript"): run.font.subscript = True
+    # Small caps
+    if run_info.get("small_caps"): run.font.small_caps = True
+    # All caps
+    if run_info.get("all_caps"): run.font.all_caps = True
+    # Hyperlink
+    if run_info.get("hyperlink"):
+        try:
+            run.hyperlink = run_info["hyperlink"]
+        except Exception:
+            pass
+
+# --- Default template ---
+# Document() unzips and parses python-docx's bundled template on every call, most of the
+# time going to styles.xml. The template is loaded once per process and every JSON->DOCX
+# conversion gets a deep copy of it. The copies share the template's styles and numbering
+# trees, which conversion only ever reads.
+_template = None
+_template_lock = threading.Lock()
+
+def default_template():
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = Document()
+        return _template
+
+def new_document():
+    """A new document from the default template, like Document() but without parsing it."""
+    template = default_template()
+    shared = {}
+    for part in template.part.package.iter_parts():
+        if isinstance(part, (StylesPart, NumberingPart)):
+            shared[id(part.element)] = part.element
+    return copy.deepcopy(template, shared)
+
+def fill_table(table, rows, image_dir):
+    # Cells are filled row by row from the w:tr/w:tc elements of the new table, since
+    # table.cell(i, j) rebuilds the whole cell grid on every lookup. Run text is written
+    # with append_run_xml: run.text clears the run with an XPath query first, which costs
+    # more than the rest of the cell put together.
+    for row, tr in zip(rows, table._tbl.tr_lst):
+        for cell, tc in zip(row, tr.tc_lst):
+            cell_blocks = cell.get("blocks", [])
+            cell_obj = _Cell(tc, table)
+            if cell_blocks:
+                for para_block in cell_blocks:
+                    if para_block.get("type") == "paragraph":
+                        p = cell_obj.add_paragraph()
+                        for run in para_block.get("runs", []):
+                            append_run_xml(p._p, run.get("text", ""))
+                    else:
+                        add_block_to_doc(cell_obj, para_block, image_dir)
+            else:
+                cell_obj.add_paragraph("")
 
 # Add heading and list support
 def add_block_to_doc(doc, block, image_dir):
@@ -362,53 +939,23 @@ def add_block_to_doc(doc, block, image_dir):
         doc_class = type(doc).__name__
         is_header_footer = doc_class in ["_HeaderPart", "_FooterPart", "_Header", "_Footer"]
         if is_header_footer:
-            # Workaround: create table in temp doc, then move XML to header/footer
-            from docx import Document
-            temp_doc = Document()
-            table = temp_doc.add_table(rows=n_rows, cols=n_cols)
-            for i, row in enumerate(rows):
-                for j, cell in enumerate(row):
-                    cell_blocks = cell.get("blocks", [])
-                    cell_obj = table.cell(i, j)
-                    print(f"[add_block_to_doc] Rendering cell ({i},{j}) in {parent_type} with {len(cell_blocks)} blocks, cell_obj type: {type(cell_obj)}")
-                    if cell_blocks:
-                        for para_block in cell_blocks:
-                            print(f"[add_block_to_doc] Adding block to cell ({i},{j}): {para_block}")
-                            if para_block.get("type") == "paragraph":
-                                p = cell_obj.add_paragraph()
-                                for run in para_block.get("runs", []):
-                                    r = p.add_run(run.get("text", ""))
-                            else:
-                                add_block_to_doc(cell_obj, para_block, image_dir)
-                    else:
-                        cell_obj.add_paragraph("")
-                    print(f"[add_block_to_doc] Cell ({i},{j}) text after add: '{cell_obj.text}'")
+            # Workaround: build the table detached, then move its XML to header/footer. It
+            # is the table Document.add_table makes, sized to the default template's text width
+            table = Table(CT_Tbl.new_tbl(n_rows, n_cols, default_template()._block_width), doc)
+            fill_table(table, rows, image_dir)
             print(f"[add_block_to_doc] Finished rendering table in {parent_type}")
             # Attach table XML to header/footer
             hdrftr_element = doc._element
             hdrftr_element.append(table._element)
         else:
             table = doc.add_table(rows=n_rows, cols=n_cols)
-            for i, row in enumerate(rows):
-                for j, cell in enumerate(row):
-                    cell_blocks = cell.get("blocks", [])
-                    cell_obj = table.cell(i, j)
-                    print(f"[add_block_to_doc] Rendering cell ({i},{j}) in {parent_type} with {len(cell_blocks)} blocks, cell_obj type: {type(cell_obj)}")
-                    if cell_blocks:
-                        for para_block in cell_blocks:
-                            print(f"[add_block_to_doc] Adding block to cell ({i},{j}): {para_block}")
-                            if para_block.get("type") == "paragraph":
-                                p = cell_obj.add_paragraph()
-                                for run in para_block.get("runs", []):
-                                    r = p.add_run(run.get("text", ""))
-                            else:
-                                add_block_to_doc(cell_obj, para_block, image_dir)
-                    else:
-                        cell_obj.add_paragraph("")
-                    print(f"[add_block_to_doc] Cell ({i},{j}) text after add: '{cell_obj.text}'")
+            fill_table(table, rows, image_dir)
             print(f"[add_block_to_doc] Finished rendering table in {parent_type}")
     elif block["type"] == "image":
         img_path = os.path.join(image_dir, block["path"])
+        if not os.path.exists(img_path):
+            # Images extracted from DOCX live in the shared content-addressed store
+            img_path = os.path.join(IMAGE_STORE_DIR, os.path.basename(block["path"]))
         width = block.get("width")
         height = block.get("height")
         if os.path.exists(img_path):
@@ -417,18 +964,20 @@ def add_block_to_doc(doc, block, image_dir):
             else:
                 doc.add_picture(img_path)
 
-def add_blocks_to_doc(doc, blocks, image_dir):
+def add_blocks_to_doc(doc, blocks, image_dir, add_block=add_block_to_doc, contents=None):
     # Only add blocks to header/footer if not already populated (avoid duplicate headers/footers)
+    # contents is what gets checked, when the caller has already resolved the header/footer part
+    contents = doc if contents is None else contents
     is_header = hasattr(doc, 'is_header') and getattr(doc, 'is_header', False)
     is_footer = hasattr(doc, 'is_footer') and getattr(doc, 'is_footer', False)
     # For headers/footers: check if already has non-empty paragraphs or tables
     already_populated = False
     if is_header or is_footer:
         # Check for non-empty paragraphs
-        if hasattr(doc, 'paragraphs') and any(p.text.strip() for p in doc.paragraphs):
+        if hasattr(contents, 'paragraphs') and any(p.text.strip() for p in contents.paragraphs):
             already_populated = True
         # Check for tables with non-empty cells
-        if hasattr(doc, 'tables') and any(any(cell.text.strip() for row in t.rows for cell in row.cells) for t in doc.tables):
+        if hasattr(contents, 'tables') and any(any(cell.text.strip() for row in t.rows for cell in row.cells) for t in contents.tables):
             already_populated = True
     if (is_header or is_footer) and already_populated:
         print(f"[add_blocks_to_doc] Skipping: header/footer already populated. Not adding blocks.")
@@ -436,35 +985,1551 @@ def add_blocks_to_doc(doc, blocks, image_dir):
     # Only add blocks if not empty
     if blocks:
         for block in blocks:
+            add_block(doc, block, image_dir)
+
+# --- Direct OOXML writer ---
+# The "xml" write engine builds the w:p/w:r elements of paragraphs, headings and list
+# items itself and inserts them straight into document.xml and the header/footer parts,
+# instead of going through python-docx's add_paragraph/add_run and property setters.
+# The XML is the same python-docx writes: run properties are built once per distinct
+# formatting (rpr_template) and copied onto every run that uses it. Tables,
+# images and anything else off this path go through add_block_to_doc, which inserts in
+# the same place, so block order is kept.
+WRITE_ENGINES = ("docx", "xml")
+WRITE_ENGINE = os.environ.get('DOCX_WRITE_ENGINE', 'docx')
+PARAGRAPH_SPACING_KEYS = ("space_before", "space_after", "line_spacing")
+W_JC = qn("w:jc")
+W_TAB = qn("w:tab")
+XML_SPACE = qn("xml:space")
+RUN_BREAK_CHARS = re.compile(r"([\t\r\n])")
+
+def append_run_xml(p, text, rPr=None):
+    # Same content as python-docx's run.text setter: w:tab for tabs, w:br for line
+    # breaks and a w:t for each stretch of other characters
+    r = etree.SubElement(p, W_R)
+    if rPr is not None:
+        r.append(copy.deepcopy(rPr))
+    if text:
+        for piece in RUN_BREAK_CHARS.split(text):
+            if piece == "\t":
+                etree.SubElement(r, W_TAB)
+            elif piece == "\r" or piece == "\n":
+                etree.SubElement(r, W_BR)
+            elif piece:
+                t = etree.SubElement(r, W_T)
+                t.text = piece
+                if len(piece.strip()) < len(piece):
+                    t.set(XML_SPACE, "preserve")
+    return r
+
+def paragraph_xml(block, style_id, text=None):
+    p = OxmlElement("w:p")
+    pPr = etree.SubElement(p, W_PPR)
+    if style_id is not None:
+        etree.SubElement(pPr, W_PSTYLE).set(W_VAL, style_id)
+    align = block.get("alignment", "left")
+    etree.SubElement(pPr, W_JC).set(W_VAL, align if align in ("center", "right") else "left")
+    if text:
+        # add_heading puts the whole heading text in a plain run ahead of the runs
+        append_run_xml(p, text)
+    for run_info in block.get("runs", []):
+        run_info = expand_run(run_info, None)
+        append_run_xml(p, run_info.get("text", ""), rpr_template(run_info))
+    return p
+
+def block_xml(doc, part, block, style_ids):
+    # The w:p add_block_to_doc would produce for this block, or None to leave the block
+    # to add_block_to_doc itself
+    block_type = block["type"]
+    if block_type == "heading":
+        level = block.get("level", 1)
+        # Only the document body has add_heading, and it rejects levels outside 0-9
+        if not hasattr(doc, 'add_heading') or not isinstance(level, int) or not 0 <= level <= 9:
+            return None
+        style = "Title" if level == 0 else f"Heading {level}"
+        text = "".join([r.get("text", "") for r in block.get("runs", [])])
+    elif block_type == "paragraph":
+        if hasattr(doc, 'is_header') or hasattr(doc, 'is_footer'):
+            if not block.get("runs") or all(not r.get("text", "").strip() for r in block.get("runs", [])):
+                return None
+        style, text = None, None
+    elif block_type == "list_item":
+        if any(key in block for key in PARAGRAPH_SPACING_KEYS):
+            return None
+        style = "List Number" if block.get("list_type") == "number" else "List Bullet"
+        text = None
+    else:
+        return None
+    if style not in style_ids:
+        style_ids[style] = part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH)
+    return paragraph_xml(block, style_ids[style], text)
+
+def write_blocks_xml(doc, blocks, image_dir):
+    """add_blocks_to_doc for the xml write engine."""
+    if hasattr(doc, 'add_heading'):
+        part, container, contents = doc.part, doc.element.body, doc
+    else:
+        # Resolving a header/footer's part walks back through the earlier sections, so
+        # it is done once here rather than on every access
+        part = doc._get_or_add_definition()
+        container = part.element
+        contents = BlockItemContainer(container, part)
+    # Body blocks go before the final w:sectPr, header/footer blocks are appended
+    anchor = container.find(W_SECTPR)
+    style_ids = {}
+    def add_block(doc, block, image_dir):
+        p = block_xml(doc, part, block, style_ids)
+        if p is None:
             add_block_to_doc(doc, block, image_dir)
+        elif anchor is not None:
+            anchor.addprevious(p)
+        else:
+            container.append(p)
+    add_blocks_to_doc(doc, blocks, image_dir, add_block, contents)
+
+def block_writer(engine=None):
+    # engine picks the write engine for JSON->DOCX: python-docx calls or direct XML
+    return write_blocks_xml if (engine or WRITE_ENGINE) == "xml" else add_blocks_to_doc
     
-# Helper to extract all blocks from a container (paragraphs and tables)
-def extract_blocks(container, output_dir, image_prefix):
-    blocks = []
+# --- Incremental re-extraction ---
+# Every body block of a DOCX->JSON extraction is recorded under a hash of its
+# element's XML, when the client asks for revisions (revision=1 or since=). When a new
+# revision of a document is uploaded with since=<revision>, blocks whose XML is
+# unchanged are taken from the earlier revision instead of being extracted again.
+# A block also depends on what its XML refers to: the names of its paragraph styles
+# and the targets of its relationships (hyperlinks). Those are resolved into the
+# block's hash, so adding a style, image or comment to a document only invalidates
+# the blocks that use it. Reuse across revisions only needs the engine, options and
+# default paragraph style (the "context") to match.
+REVISION_CACHE_ITEMS = int(os.environ.get('REVISION_CACHE_ITEMS', 16))
+_revisions_lock = threading.Lock()
+_revisions = OrderedDict()  # revision -> {"context", "hashes", "blocks"}, least recently used first
+BLOCK_REFS = etree.XPath(".//w:pStyle/@w:val | .//@r:id", namespaces={"w": nsmap["w"], "r": nsmap["r"]})
+
+def element_digest(element, style_names, rels):
+    content = hashlib.blake2b(etree.tostring(element), digest_size=16)
+    refs = [style_names.get(value) if value.attrname == W_VAL else rels.get(str(value))
+            for value in BLOCK_REFS(element)]
+    if refs:
+        content.update(repr(refs).encode())
+    return content.digest()
+
+def new_block_memo(previous=None):
+    """Start recording block hashes for one extraction, reusing the blocks of `previous`
+    once the engine has set the context (set_memo_context)."""
+    return {"context": None, "hashes": [], "blocks": {}, "reuse": {}, "previous": previous,
+            "style_names": {}, "rels": {}}
+
+def set_memo_context(memo, ctx, engine, options):
+    # ctx holds the style names and relationships, as open_stream_context or
+    # document_context read them
+    previous = memo.pop("previous")
+    context = extraction_context(ctx, engine, options)
+    memo["context"] = context
+    memo["style_names"] = ctx["style_names"]
+    memo["rels"] = ctx["rels"]
+    memo["reuse"] = previous["blocks"] if previous and previous["context"] == context else {}
+
+def memo_lookup(memo, element, extract):
+    # (digest, block): the earlier revision's block for unchanged XML, else a fresh extraction
+    digest = element_digest(element, memo["style_names"], memo["rels"])
+    block = memo["reuse"].get(digest)
+    if block is None:
+        block = memo["blocks"].get(digest)
+    if block is None:
+        block = extract()
+    return digest, block
+
+def memo_record(memo, digest, block):
+    memo["hashes"].append(digest)
+    memo["blocks"][digest] = block
+
+def memo_block(memo, element, extract):
+    if memo is None:
+        return extract()
+    digest, block = memo_lookup(memo, element, extract)
+    memo_record(memo, digest, block)
+    return block
+
+def get_revision(revision):
+    with _revisions_lock:
+        entry = _revisions.get(revision)
+        if entry is not None:
+            _revisions.move_to_end(revision)
+        return entry
+
+def record_revision(revision, memo):
+    if REVISION_CACHE_ITEMS <= 0:
+        return
+    with _revisions_lock:
+        _revisions[revision] = {"context": memo["context"], "hashes": memo["hashes"], "blocks": memo["blocks"]}
+        _revisions.move_to_end(revision)
+        while len(_revisions) > REVISION_CACHE_ITEMS:
+            _revisions.popitem(last=False)
+
+def changed_blocks(entry, previous):
+    """(changed, removed): indices of new or modified blocks in `entry` and of blocks of
+    `previous` that no longer appear. Without a known base revision every block has changed."""
+    if previous is None or previous["context"] != entry["context"]:
+        return list(range(len(entry["hashes"]))), []
+    # Align the two block sequences, so duplicated and moved blocks are reported too
+    matcher = difflib.SequenceMatcher(None, previous["hashes"], entry["hashes"], autojunk=False)
+    changed = []
+    removed = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            removed.extend(range(i1, i2))
+            changed.extend(range(j1, j2))
+    return changed, removed
+
+def iter_block_elements(element):
+    # w:p and w:tbl children in document order, descending into w:sdt content
+    for child in element:
+        if child.tag == W_P or child.tag == W_TBL:
+            yield child
+        elif child.tag == W_SDT:
+            content = child.find(W_SDT_CONTENT)
+            if content is not None:
+                yield from iter_block_elements(content)
+
+# Helper to iterate all blocks from a container (paragraphs and tables)
+def iter_blocks(container, options=None, memo=None):
+    if options and options.get("order") == "document":
+        # Single pass over the container's children, in reading order
+        body = getattr(container, '_body', None)
+        element = body._element if body is not None else container._element
+        for child in iter_block_elements(element):
+            if child.tag == W_P:
+                block = memo_block(memo, child, lambda: extract_paragraph_block(Paragraph(child, container), options))
+            else:
+                block = memo_block(memo, child, lambda: extract_table_block(Table(child, container), options))
+            if block is not None:
+                yield block
+        return
     for paragraph in container.paragraphs:
-        block = extract_paragraph_block(paragraph)
-        if block:
-            blocks.append(block)
+        block = memo_block(memo, paragraph._element, lambda: extract_paragraph_block(paragraph, options))
+        if block is not None:
+            yield block
     for table in getattr(container, 'tables', []):
-        block = extract_table_block(table)
-        if block:
-            blocks.append(block)
+        block = memo_block(memo, table._tbl, lambda: extract_table_block(table, options))
+        if block is not None:
+            yield block
+
+# Helper to extract all blocks from a container (paragraphs and tables)
+def extract_blocks(container, output_dir, image_prefix, options=None, memo=None):
+    return list(iter_blocks(container, options, memo))
+
+def section_part_entry(seen_parts, part_key, idx, htype, extract, options):
+    # Sections linked to previous share a header/footer part: extract each part once
+    # per document and, with headers=ref, point repeats at the first occurrence
+    if part_key in seen_parts:
+        first_idx, first_htype, blocks = seen_parts[part_key]
+        if options and options.get("headers") == "ref":
+            return {"same_as": {"section": first_idx, "part": first_htype}}
+        return blocks
+    blocks = extract()
+    seen_parts[part_key] = (idx, htype, blocks)
     return blocks
 
-def extract_all_sections(doc, output_dir, image_prefix):
+def extract_section_parts(doc, output_dir, image_prefix, options=None):
     sections = []
+    seen_parts = {}
     for idx, section in enumerate(doc.sections):
         sec = {}
         for htype, attr in [("header", "header"), ("first_page_header", "first_page_header"), ("even_page_header", "even_page_header"),
                             ("footer", "footer"), ("first_page_footer", "first_page_footer"), ("even_page_footer", "even_page_footer")]:
             part = getattr(section, attr, None)
             if part:
-                sec[htype] = extract_blocks(part, output_dir, f"{image_prefix}_sec{idx}_{htype}")
+                sec[htype] = section_part_entry(
+                    seen_parts, part.part.partname, idx, htype,
+                    lambda: extract_blocks(part, output_dir, f"{image_prefix}_sec{idx}_{htype}", options), options)
         sections.append(sec)
-    body = extract_blocks(doc, output_dir, os.path.splitext(os.path.basename(getattr(doc, 'filename', 'document')))[0])
-    return {"sections": sections, "body": body}
+    return sections
+
+def extract_all_sections(doc, output_dir, image_prefix, options=None, memo=None):
+    sections = extract_section_parts(doc, output_dir, image_prefix, options)
+    body = extract_blocks(doc, output_dir, os.path.splitext(os.path.basename(getattr(doc, 'filename', 'document')))[0], options, memo)
+    result = {"sections": sections, "body": body}
+    if options and options.get("images") == "store":
+        result["images"] = extract_images_from_doc(doc, image_prefix)
+    return result
+
+# --- Streaming extraction engine ---
+# Reads word/document.xml straight from the DOCX zip with lxml.etree.iterparse in a
+# single forward pass and produces the same {"sections": [...], "body": [...]}
+# structure as extract_all_sections. Each body element is cleared as soon as its
+# block has been built, so memory stays flat regardless of document length.
+REL_OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+REL_STYLES = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+HDRFTR_REFERENCES = [
+    ("header", qn("w:headerReference"), "default"),
+    ("first_page_header", qn("w:headerReference"), "first"),
+    ("even_page_header", qn("w:headerReference"), "even"),
+    ("footer", qn("w:footerReference"), "default"),
+    ("first_page_footer", qn("w:footerReference"), "first"),
+    ("even_page_footer", qn("w:footerReference"), "even"),
+]
+RUN_TEXT_TAGS = {
+    qn("w:tab"): "\t",
+    qn("w:ptab"): "\t",
+    qn("w:cr"): "\n",
+    qn("w:noBreakHyphen"): "-",
+}
+ENGINES = ("docx", "stream")
+EXTRACT_ENGINE = os.environ.get('DOCX_EXTRACT_ENGINE', 'docx')
+TABLE_MODES = ("cells", "spans")
+BLOCK_ORDERS = ("grouped", "document")
+IMAGE_MODES = ("none", "store")
+HEADER_MODES = ("full", "ref")
+RUN_MODES = ("merged", "split")
+EXTRACT_MODES = ("full", "text")
+
+def parse_extraction_options(args):
+    """Build extraction options from request query arguments. Returns (options, error message)."""
+    options = {}
+    tables = args.get('tables', 'cells')
+    if tables not in TABLE_MODES:
+        return None, f"Unknown tables mode '{tables}', expected one of {', '.join(TABLE_MODES)}"
+    options["tables"] = tables
+    order = args.get('order', 'grouped')
+    if order not in BLOCK_ORDERS:
+        return None, f"Unknown order '{order}', expected one of {', '.join(BLOCK_ORDERS)}"
+    options["order"] = order
+    images = args.get('images', 'none')
+    if images not in IMAGE_MODES:
+        return None, f"Unknown images mode '{images}', expected one of {', '.join(IMAGE_MODES)}"
+    options["images"] = images
+    headers = args.get('headers', 'full')
+    if headers not in HEADER_MODES:
+        return None, f"Unknown headers mode '{headers}', expected one of {', '.join(HEADER_MODES)}"
+    options["headers"] = headers
+    runs = args.get('runs', 'merged')
+    if runs not in RUN_MODES:
+        return None, f"Unknown runs mode '{runs}', expected one of {', '.join(RUN_MODES)}"
+    options["runs"] = runs
+    schema = args.get('schema', 'full')
+    if schema not in SCHEMAS:
+        return None, f"Unknown schema '{schema}', expected one of {', '.join(SCHEMAS)}"
+    options["schema"] = schema
+    mode = args.get('mode', 'full')
+    if mode not in EXTRACT_MODES:
+        return None, f"Unknown mode '{mode}', expected one of {', '.join(EXTRACT_MODES)}"
+    options["mode"] = mode
+    fields, error = parse_fields(args.get('fields'))
+    if error:
+        return None, error
+    options["fields"] = fields
+    return options, None
+
+_enum_str_cache = {}
+
+def _enum_str(enum_cls, xml_value):
+    # str() of the python-docx enum member for an XML value, None when the member is falsy
+    key = (enum_cls, xml_value)
+    if key not in _enum_str_cache:
+        member = enum_cls.from_xml(xml_value)
+        _enum_str_cache[key] = str(member) if member else None
+    return _enum_str_cache[key]
+
+def _on_off(element):
+    return element is not None and element.get(W_VAL, "true") in ("1", "true", "on")
+
+def read_part_rels(zf, part_name):
+    """Map rId -> (reltype, target) for a package part ("" for the package itself)."""
+    base = posixpath.dirname(part_name)
+    rels_name = posixpath.join(base, "_rels", posixpath.basename(part_name) + ".rels")
+    try:
+        root = etree.fromstring(zf.read(rels_name))
+    except KeyError:
+        return {}
+    rels = {}
+    for rel in root:
+        target = rel.get("Target")
+        if rel.get("TargetMode") != "External":
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(base, target))
+        rels[rel.get("Id")] = (rel.get("Type"), target)
+    return rels
 
-def convert_document(doc_file, target_format):
+def read_paragraph_styles(styles_xml):
+    """Return ({style_id: ui_name}, default_name) for the paragraph styles in styles.xml."""
+    return paragraph_style_names(etree.fromstring(styles_xml))
+
+def paragraph_style_names(root):
+    first_by_id = {}
+    default_name = None
+    for style in root.iterchildren(qn("w:style")):
+        style_type = style.get(W_TYPE, "paragraph")
+        name_el = style.find(qn("w:name"))
+        name = name_el.get(W_VAL) if name_el is not None else None
+        if name is not None:
+            name = BabelFish.internal2ui(name)
+        first_by_id.setdefault(style.get(qn("w:styleId")), (style_type, name))
+        if style_type == "paragraph" and style.get(qn("w:default")) in ("1", "true", "on"):
+            default_name = name
+    names = {style_id: name for style_id, (style_type, name) in first_by_id.items() if style_type == "paragraph"}
+    return names, default_name
+
+def open_stream_context(zf, options=None):
+    """Resolve the main document part, its relationships and paragraph styles."""
+    document_part = "word/document.xml"
+    for reltype, target in read_part_rels(zf, "").values():
+        if reltype == REL_OFFICE_DOCUMENT:
+            document_part = target
+    rels = read_part_rels(zf, document_part)
+    styles_part = next((target for reltype, target in rels.values() if reltype == REL_STYLES), None)
+    try:
+        styles_xml = zf.read(styles_part) if styles_part else None
+    except KeyError:
+        styles_xml = None
+    if styles_xml is None:
+        # python-docx falls back to its bundled styles when the package has none
+        styles_xml = StylesPart._default_styles_xml()
+    style_names, default_style = read_paragraph_styles(styles_xml)
+    return {
+        "document_part": document_part,
+        "rels": rels,
+        "style_names": style_names,
+        "default_style": default_style,
+        "sect_refs": [],
+        "options": options or {},
+        "memo": None,
+    }
+
+def stream_run_text(r):
+    text = []
+    for child in r:
+        tag = child.tag
+        if tag == W_T:
+            text.append(child.text or "")
+        elif tag in RUN_TEXT_TAGS:
+            text.append(RUN_TEXT_TAGS[tag])
+        elif tag == W_BR and child.get(W_TYPE, "textWrapping") == "textWrapping":
+            text.append("\n")
+    return "".join(text)
+
+def stream_run_data(r, fields=None):
+    text = []
+    rPr = None
+    for child in r:
+        tag = child.tag
+        if tag == W_T:
+            text.append(child.text or "")
+        elif tag in RUN_TEXT_TAGS:
+            text.append(RUN_TEXT_TAGS[tag])
+        elif tag == W_BR:
+            if child.get(W_TYPE, "textWrapping") == "textWrapping":
+                text.append("\n")
+        elif tag == W_RPR and rPr is None:
+            rPr = child
+    run_data = {"text": "".join(text)} if wants(fields, "text") else {}
+    if rPr is None or not wants(fields, *RUN_FORMAT_FIELDS):
+        return run_data
+    # First occurrence of each property wins, as with python-docx's ZeroOrOne children
+    props = {child.tag: child for child in reversed(rPr)}
+    if wants(fields, "bold") and _on_off(props.get(W_B)):
+        run_data["bold"] = True
+    if wants(fields, "italic") and _on_off(props.get(W_I)):
+        run_data["italic"] = True
+    u = props.get(W_U) if wants(fields, "underline") else None
+    if u is not None and u.get(W_VAL) not in (None, "none"):
+        run_data["underline"] = True
+    sz = props.get(W_SZ) if wants(fields, "font_size") else None
+    if sz is not None:
+        size = ST_HpsMeasure.convert_from_xml(sz.get(W_VAL))
+        if size:
+            run_data["font_size"] = size.pt
+    rFonts = props.get(W_RFONTS) if wants(fields, "font_name") else None
+    if rFonts is not None and rFonts.get(W_ASCII):
+        run_data["font_name"] = rFonts.get(W_ASCII)
+    color = props.get(W_COLOR) if wants(fields, "color", "color_theme") else None
+    if color is not None:
+        if color.get(W_VAL) not in (None, "auto"):
+            run_data["color"] = str(RGBColor.from_string(color.get(W_VAL)))
+        elif color.get(W_THEME_COLOR):
+            theme = _enum_str(MSO_THEME_COLOR, color.get(W_THEME_COLOR))
+            if theme:
+                run_data["color_theme"] = theme
+    highlight = props.get(W_HIGHLIGHT) if wants(fields, "highlight") else None
+    if highlight is not None:
+        highlight = _enum_str(WD_COLOR_INDEX, highlight.get(W_VAL))
+        if highlight:
+            run_data["highlight"] = highlight
+    if wants(fields, "strikethrough") and _on_off(props.get(W_STRIKE)):
+        run_data["strikethrough"] = True
+    vert_align = props.get(W_VERT_ALIGN) if wants(fields, "superscript", "subscript") else None
+    if vert_align is not None and vert_align.get(W_VAL) == "superscript":
+        run_data["superscript"] = True
+    if vert_align is not None and vert_align.get(W_VAL) == "subscript":
+        run_data["subscript"] = True
+    if wants(fields, "small_caps") and _on_off(props.get(W_SMALL_CAPS)):
+        run_data["small_caps"] = True
+    if wants(fields, "all_caps") and _on_off(props.get(W_CAPS)):
+        run_data["all_caps"] = True
+    return project(run_data, fields)
+
+def stream_paragraph_text(p):
+    # Same text python-docx uses for Paragraph.text: runs plus hyperlink runs
+    text = []
+    for child in p:
+        if child.tag == W_R:
+            text.append(stream_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            text.extend(stream_run_text(r) for r in child.iterchildren(W_R))
+    return "".join(text)
+
+def iter_stream_runs(p, ctx, fields=None):
+    # Run data for the w:r children of a w:p and of its w:hyperlink children, the latter
+    # with the hyperlink's target as extract_runs resolves it
+    for child in p.iterchildren(W_R, W_HYPERLINK):
+        if child.tag == W_R:
+            yield stream_run_data(child, fields)
+            continue
+        target = None
+        if wants(fields, "hyperlink"):
+            rel = ctx["rels"].get(child.get(R_ID))
+            if rel is not None:
+                target = rel[1]
+        for r in child.iterchildren(W_R):
+            run_data = stream_run_data(r, fields)
+            if target is not None:
+                run_data["hyperlink"] = target
+            yield run_data
+
+def stream_paragraph_block(p, ctx):
+    style_id = None
+    alignment = None
+    pPr = p.find(W_PPR)
+    if pPr is not None:
+        pStyle = pPr.find(qn("w:pStyle"))
+        if pStyle is not None:
+            style_id = pStyle.get(W_VAL)
+        jc = pPr.find(qn("w:jc"))
+        if jc is not None:
+            alignment = _enum_str(WD_ALIGN_PARAGRAPH, jc.get(W_VAL))
+    if style_id is None:
+        style_name = ctx["default_style"]
+    else:
+        style_name = ctx["style_names"].get(style_id, ctx["default_style"])
+    if style_name is None:
+        style_name = "Normal"
+    fields = ctx["options"].get("fields")
+    block_fields = fields["block"] if fields else None
+    if wants(block_fields, *PARAGRAPH_FEATURE_FIELDS):
+        features = scan_paragraph_features(p)
+    else:
+        features = {"numbered": False, "page_break": False, "bookmarks": [], "comments": False}
+    if style_name.startswith("Heading"):
+        try:
+            level = int(style_name.split()[-1])
+        except Exception:
+            level = 1
+        block = {"type": "heading", "level": level}
+    elif "List" in style_name or features["numbered"]:
+        block = {"type": "list_item", "list_type": "number" if "Number" in style_name else "bullet"}
+    else:
+        block = {"type": "paragraph"}
+    if wants(block_fields, "runs"):
+        run_fields = fields["run"] if fields else None
+        runs = list(iter_stream_runs(p, ctx, run_fields))
+        block["runs"] = coalesce_runs(runs) if coalescing(ctx["options"]) else runs
+    if wants(block_fields, "alignment"):
+        block["alignment"] = alignment or "left"
+    block["style"] = style_name
+    if features["page_break"]:
+        block["page_break"] = True
+    if features["bookmarks"]:
+        # Attribute lookup kept identical to extract_paragraph_block
+        block["bookmarks"] = [bm.get("w:name") for bm in features["bookmarks"] if bm.get("w:name")]
+    if features["comments"]:
+        block["comments"] = True
+    return project(block, block_fields)
+
+def stream_cell_data(tc, ctx):
+    fields = ctx["options"].get("fields")
+    cell_fields = fields["cell"] if fields else None
+    cell_blocks = [stream_paragraph_block(p, ctx) for p in tc.iterchildren(W_P) if stream_paragraph_text(p).strip()]
+    # Cell properties: merge, width, shading (same lookups as extract_table_block)
+    cell_props = {}
+    gridspan = next(tc.iter(W_GRID_SPAN), None) if wants(cell_fields, "colspan") else None
+    if gridspan is not None:
+        cell_props["colspan"] = int(gridspan.get("w:val", "1"))
+    if wants(cell_fields, "rowspan") and next(tc.iter(W_VMERGE), None) is not None:
+        cell_props["rowspan"] = True
+    width = next(tc.iter(W_TCW), None) if wants(cell_fields, "width") else None
+    if width is not None:
+        cell_props["width"] = int(width.get("w:w", "0"))
+    shading = next(tc.iter(W_SHD), None) if wants(cell_fields, "shading") else None
+    if shading is not None:
+        cell_props["shading"] = shading.get("w:fill")
+    return {"blocks": cell_blocks, **cell_props}
+
+def stream_table_block(tbl, ctx):
+    if ctx["options"].get("tables") == "spans":
+        return extract_table_spans(tbl, lambda p: stream_paragraph_block(p, ctx), ctx["options"].get("fields"))
+    # Layout-grid walk matching python-docx row.cells: spanned cells repeat and
+    # vMerge="continue" cells resolve to the cell above at the same grid offset
+    rows = []
+    above = {}
+    for tr in tbl.iterchildren(W_TR):
+        offset = _tr_grid_before(tr)
+        row_cells = []
+        current = {}
+        for tc in tr.iterchildren(W_TC):
+            _, span, vmerge = _tc_merge_props(tc)
+            if vmerge == "continue" and offset in above:
+                cell, cell_span = above[offset]
+            else:
+                cell, cell_span = stream_cell_data(tc, ctx), span
+            row_cells.extend([cell] * cell_span)
+            current[offset] = (cell, cell_span)
+            offset += span
+        rows.append(row_cells)
+        above = current
+    fields = ctx["options"].get("fields")
+    return project({"type": "table", "rows": rows}, fields["block"] if fields else None)
+
+def stream_container_blocks(container, ctx):
+    if ctx["options"].get("order") == "document":
+        return [stream_paragraph_block(el, ctx) if el.tag == W_P else stream_table_block(el, ctx)
+                for el in iter_block_elements(container)]
+    # Paragraphs first, then tables, in the same order as extract_blocks
+    blocks = [stream_paragraph_block(p, ctx) for p in container.iterchildren(W_P)]
+    blocks.extend(stream_table_block(tbl, ctx) for tbl in container.iterchildren(W_TBL))
+    return blocks
+
+def _record_sect_refs(sectPr, ctx):
+    refs = {}
+    for ref in sectPr:
+        key = (ref.tag, ref.get(W_TYPE))
+        if key not in refs:
+            refs[key] = ref.get(R_ID)
+    ctx["sect_refs"].append(refs)
+
+def iter_stream_body(zf, ctx):
+    """Yield body blocks from a single iterparse pass over the main document part."""
+    document_order = ctx["options"].get("order") == "document"
+    pending_tables = []
+    with zf.open(ctx["document_part"]) as source:
+        for _, elem in etree.iterparse(source, events=("end",), tag=(W_P, W_TBL, W_SDT, W_SECTPR)):
+            parent = elem.getparent()
+            if parent is None or parent.tag != W_BODY:
+                continue
+            if elem.tag == W_P:
+                yield memo_block(ctx["memo"], elem, lambda: stream_paragraph_block(elem, ctx))
+                pPr = elem.find(W_PPR)
+                if pPr is not None and pPr.find(W_SECTPR) is not None:
+                    _record_sect_refs(pPr.find(W_SECTPR), ctx)
+            elif elem.tag == W_TBL:
+                if document_order:
+                    yield memo_block(ctx["memo"], elem, lambda: stream_table_block(elem, ctx))
+                elif ctx["memo"] is not None:
+                    # Looked up now, before the element is cleared; recorded in output order below
+                    pending_tables.append(memo_lookup(ctx["memo"], elem, lambda: stream_table_block(elem, ctx)))
+                else:
+                    pending_tables.append((None, stream_table_block(elem, ctx)))
+            elif elem.tag == W_SDT:
+                # Content controls only contribute blocks in document order
+                content = elem.find(W_SDT_CONTENT)
+                if document_order and content is not None:
+                    for el in iter_block_elements(content):
+                        if el.tag == W_P:
+                            yield memo_block(ctx["memo"], el, lambda: stream_paragraph_block(el, ctx))
+                        else:
+                            yield memo_block(ctx["memo"], el, lambda: stream_table_block(el, ctx))
+            else:
+                _record_sect_refs(elem, ctx)
+            # Free the handled element and everything before it in the body
+            elem.clear()
+            while elem.getprevious() is not None:
+                del parent[0]
+    for digest, block in pending_tables:
+        if digest is not None:
+            memo_record(ctx["memo"], digest, block)
+        yield block
+
+def stream_extract_sections(zf, ctx):
+    """Extract headers/footers for the sections recorded by iter_stream_body."""
+    def extract_part(part_name, htype):
+        if part_name is not None:
+            root = etree.fromstring(zf.read(part_name))
+        elif htype.endswith("header"):
+            root = etree.fromstring(HeaderPart._default_header_xml())
+        else:
+            root = etree.fromstring(FooterPart._default_footer_xml())
+        # Hyperlinks in a header/footer refer to the relationships of its own part
+        return stream_container_blocks(root, dict(ctx, rels=read_part_rels(zf, part_name) if part_name else {}))
+
+    sections = []
+    seen_parts = {}
+    current_refs = {}
+    for idx, refs in enumerate(ctx["sect_refs"]):
+        # Linked-to-previous sections inherit the nearest prior definition
+        current_refs.update(refs)
+        sec = {}
+        for htype, ref_tag, ref_type in HDRFTR_REFERENCES:
+            part_name = ctx["rels"].get(current_refs.get((ref_tag, ref_type)), (None, None))[1]
+            # python-docx adds a separate default part per header/footer type when none exists
+            part_key = part_name if part_name is not None else ("default", htype)
+            sec[htype] = section_part_entry(seen_parts, part_key, idx, htype,
+                                            lambda: extract_part(part_name, htype), ctx["options"])
+        sections.append(sec)
+    return sections
+
+def read_content_types(zf):
+    """Return a function mapping a part name to its content type from [Content_Types].xml."""
+    root = etree.fromstring(zf.read("[Content_Types].xml"))
+    defaults = {}
+    overrides = {}
+    for el in root:
+        if el.get("Extension") is not None:
+            defaults[el.get("Extension").lower()] = el.get("ContentType")
+        elif el.get("PartName") is not None:
+            overrides[el.get("PartName")] = el.get("ContentType")
+    def content_type(part_name):
+        return overrides.get("/" + part_name) or defaults.get(posixpath.splitext(part_name)[1][1:].lower(), "")
+    return content_type
+
+def stream_extract_images(zf, ctx, image_prefix):
+    # Same image list as extract_images_from_doc, read straight from the zip
+    content_type = read_content_types(zf)
+    image_blocks = []
+    for reltype, target in ctx["rels"].values():
+        if reltype != REL_IMAGE:
+            continue
+        try:
+            blob = zf.read(target)
+        except KeyError:
+            continue  # external (linked) image
+        image_blocks.append(image_block(image_prefix, blob, content_type(target)))
+    return image_blocks
+
+def stream_extract_all_sections(docx_path, options=None, image_prefix=None, memo=None):
+    """Streaming counterpart of extract_all_sections that never builds the python-docx object model."""
+    with zipfile.ZipFile(docx_path) as zf:
+        ctx = open_stream_context(zf, options)
+        if memo is not None:
+            set_memo_context(memo, ctx, "stream", options)
+        ctx["memo"] = memo
+        body = list(iter_stream_body(zf, ctx))
+        sections = stream_extract_sections(zf, ctx)
+        result = {"sections": sections, "body": body}
+        if ctx["options"].get("images") == "store":
+            result["images"] = stream_extract_images(zf, ctx, image_prefix or source_image_prefix(docx_path))
+    return result
+
+# --- DOCX sources ---
+# Extraction reads a DOCX from a path or from a seekable binary file object, such as
+# an upload that is kept in memory. Uploads are held in a SpooledTemporaryFile, so
+# they only reach the disk (as an anonymous, self-deleting temp file) past
+# SPOOL_MEMORY_BYTES; the API never saves an upload under a name that needs cleaning up.
+def is_docx_file(docx_path):
+    return not isinstance(docx_path, (str, os.PathLike))
+
+def iter_docx_bytes(docx_path, chunk_size=1024 * 1024):
+    # The bytes of a DOCX source, in chunks
+    if is_docx_file(docx_path):
+        docx_path.seek(0)
+        yield from iter(lambda: docx_path.read(chunk_size), b'')
+    else:
+        with open(docx_path, 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+
+def docx_digest(docx_path):
+    # SHA-256 hex digest of the bytes of a DOCX source
+    content = hashlib.sha256()
+    for chunk in iter_docx_bytes(docx_path):
+        content.update(chunk)
+    return content.hexdigest()
+
+def source_image_prefix(docx_path, digest=None):
+    # Prefix of the image ids of one extraction source. Uploads are named by their
+    # content, so the same upload always gets the same ids and different ones never share
+    name = f"upload:{digest or docx_digest(docx_path)}" if is_docx_file(docx_path) else os.fspath(docx_path)
+    return hashlib.md5(name.encode()).hexdigest()
+
+def spool_upload(file):
+    """Copy an uploaded file into a spooled buffer that outlives the request, for
+    extraction that continues after the response has started (NDJSON and paging)."""
+    source = tempfile.SpooledTemporaryFile(SPOOL_MEMORY_BYTES)
+    file.save(source)
+    source.seek(0)
+    return source
+
+class SpooledRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Werkzeug writes uploads over 500 KB to a temp file; keep them in memory up to SPOOL_MEMORY_BYTES
+        return tempfile.SpooledTemporaryFile(SPOOL_MEMORY_BYTES)
+
+# --- Text-only extraction ---
+# mode=text is for indexing: it skips python-docx and run/table formatting entirely
+# and only concatenates w:t, w:tab and w:br text per paragraph, read straight from
+# the zip member with iterparse. Paragraphs in tables and content controls are
+# included in reading order; headers and footers are not.
+TEXT_TAGS = (W_T, qn("w:tab"), W_BR, qn("w:cr"))
+W_PSTYLE = qn("w:pStyle")
+W_OUTLINE_LVL = qn("w:outlineLvl")
+
+def heading_level(style_name):
+    # Heading level of a paragraph style as used by add_heading: "Title" is 0, "Heading N" is N
+    if style_name == "Title":
+        return 0
+    if style_name and style_name.startswith("Heading "):
+        level = style_name[len("Heading "):]
+        if level.isdigit():
+            return int(level)
+    return None
+
+def iter_text_paragraphs(docx_path):
+    """Yield {"text": ...} per paragraph, with "heading_level" for headings."""
+    with zipfile.ZipFile(docx_path) as zf:
+        ctx = open_stream_context(zf)
+        style_levels = {style_id: heading_level(name) for style_id, name in ctx["style_names"].items()}
+        default_level = heading_level(ctx["default_style"])
+        with zf.open(ctx["document_part"]) as source:
+            for _, p in etree.iterparse(source, events=("end",), tag=W_P):
+                if in_fallback(p):
+                    # The mc:Choice copy of this text box has already been yielded
+                    p.clear()
+                    continue
+                text = []
+                for el in p.iter(*TEXT_TAGS):
+                    if el.tag == W_T:
+                        text.append(el.text or "")
+                    elif el.tag == W_BR:
+                        text.append("\n" if el.get(W_TYPE, "textWrapping") == "textWrapping" else "")
+                    else:
+                        text.append(RUN_TEXT_TAGS[el.tag])
+                paragraph = {"text": "".join(text)}
+                level = default_level
+                pPr = p.find(W_PPR)
+                if pPr is not None:
+                    pStyle = pPr.find(W_PSTYLE)
+                    if pStyle is not None:
+                        level = style_levels.get(pStyle.get(W_VAL), default_level)
+                    outline = pPr.find(W_OUTLINE_LVL)
+                    if level is None and outline is not None and outline.get(W_VAL, "9").isdigit() and int(outline.get(W_VAL)) < 9:
+                        level = int(outline.get(W_VAL)) + 1
+                if level is not None:
+                    paragraph["heading_level"] = level
+                yield paragraph
+                # Nested paragraphs (text boxes) end first and are cleared, so their
+                # text is not repeated in the enclosing paragraph
+                p.clear()
+                parent = p.getparent()
+                if parent is not None and parent.tag == W_BODY:
+                    while p.getprevious() is not None:
+                        del parent[0]
+
+def extract_text(docx_path):
+    return {"mode": "text", "paragraphs": list(iter_text_paragraphs(docx_path))}
+
+def iter_extraction_records(docx_path, engine=None, options=None, doc=None):
+    """Yield body blocks one at a time, then a {"type": "sections"} record and, with
+    images=store, an {"type": "images"} record. Pass an already opened Document as
+    `doc` to reuse it with the docx engine."""
+    image_prefix = source_image_prefix(docx_path)
+    images = None
+    if (engine or EXTRACT_ENGINE) == "stream":
+        with zipfile.ZipFile(docx_path) as zf:
+            ctx = open_stream_context(zf, options)
+            yield from iter_stream_body(zf, ctx)
+            sections = stream_extract_sections(zf, ctx)
+            if ctx["options"].get("images") == "store":
+                images = stream_extract_images(zf, ctx, image_prefix)
+    else:
+        if doc is None:
+            doc = Document(docx_path)
+        yield from iter_blocks(doc, options)
+        sections = extract_section_parts(doc, None, image_prefix, options)
+        if options and options.get("images") == "store":
+            images = extract_images_from_doc(doc, image_prefix)
+    yield {"type": "sections", "sections": sections}
+    if images is not None:
+        yield {"type": "images", "images": images}
+
+def iter_ndjson_lines(docx_path, engine=None, options=None):
+    """Yield DOCX->JSON output as NDJSON: one body block per line, then a final sections record."""
+    for record in iter_extraction_records(docx_path, engine, options):
+        yield encode_json(record) + b"\n"
+
+# --- Paged extraction ---
+# A page request extracts body blocks only up to offset + limit and then stops. The
+# open document and its position are kept in a short-lived handle named by the
+# returned cursor, so the next page continues from where the previous one stopped
+# instead of re-opening the DOCX.
+PAGE_HANDLE_TTL = float(os.environ.get('PAGE_HANDLE_TTL', 120))
+PAGE_HANDLE_MAX = int(os.environ.get('PAGE_HANDLE_MAX', 32))
+_page_handles_lock = threading.Lock()
+_page_handles = OrderedDict()  # cursor -> handle, least recently used first
+
+def _close_page_handle(handle):
+    records = handle.get("records")
+    if records is not None:
+        records.close()  # closes the zip file of the stream engine
+
+def _expire_page_handles(now):
+    # Called with _page_handles_lock held
+    while _page_handles:
+        cursor, handle = next(iter(_page_handles.items()))
+        if len(_page_handles) <= PAGE_HANDLE_MAX and handle["expires"] > now:
+            break
+        del _page_handles[cursor]
+        # A handle serving a page right now is left to be garbage collected
+        if handle["lock"].acquire(blocking=False):
+            try:
+                _close_page_handle(handle)
+            finally:
+                handle["lock"].release()
+
+def open_page_handle(docx_path, engine=None, options=None):
+    """Register a paged-extraction handle for an uploaded DOCX and return its cursor."""
+    engine = engine or EXTRACT_ENGINE
+    handle = {
+        "path": docx_path,
+        "engine": engine,
+        "options": options,
+        # The docx engine parses the whole package up front, so only the stream engine
+        # pages without reading the full document; rewinding reuses the parsed document
+        "doc": Document(docx_path) if engine == "docx" else None,
+        "records": None,
+        "position": 0,
+        "tail": {},
+        "done": False,
+        "lock": threading.Lock(),
+        "expires": time.monotonic() + PAGE_HANDLE_TTL,
+    }
+    cursor = secrets.token_urlsafe(16)
+    with _page_handles_lock:
+        _page_handles[cursor] = handle
+        _expire_page_handles(time.monotonic())
+    return cursor
+
+def get_page_handle(cursor):
+    now = time.monotonic()
+    with _page_handles_lock:
+        _expire_page_handles(now)
+        handle = _page_handles.get(cursor)
+        if handle is not None:
+            _page_handles.move_to_end(cursor)
+            handle["expires"] = now + PAGE_HANDLE_TTL
+    return handle
+
+def _rewind_page_handle(handle):
+    _close_page_handle(handle)
+    handle["records"] = iter_extraction_records(handle["path"], handle["engine"], handle["options"], handle["doc"])
+    handle["position"] = 0
+    handle["tail"] = {}
+    handle["done"] = False
+
+def _next_page_block(handle):
+    # Next body block from the handle, or None once the body is exhausted
+    if handle["done"]:
+        return None
+    for record in handle["records"]:
+        if record.get("type") in ("sections", "images"):
+            handle["tail"][record["type"]] = record[record["type"]]
+            continue
+        handle["position"] += 1
+        return record
+    handle["done"] = True
+    return None
+
+def extract_page(cursor, offset=None, limit=50):
+    """Return body blocks [offset, offset + limit) of the document behind `cursor`.
+
+    Sections (and images) are only known once the whole body has been read, so they
+    are added to the page that reaches the end of the document.
+    """
+    handle = get_page_handle(cursor)
+    if handle is None:
+        return None
+    with handle["lock"]:
+        if offset is None:
+            offset = handle["position"]
+        if handle["records"] is None or offset < handle["position"]:
+            _rewind_page_handle(handle)
+        while handle["position"] < offset and _next_page_block(handle) is not None:
+            pass
+        body = []
+        while len(body) < limit:
+            block = _next_page_block(handle)
+            if block is None:
+                break
+            body.append(block)
+        page = {"body": body, "offset": offset, "limit": limit, "cursor": cursor,
+                "next_offset": None if handle["done"] else offset + len(body)}
+        if handle["done"]:
+            page.update(handle["tail"])
+    return page
+
+def resolve_section_refs(sections):
+    # Expand {"same_as": {"section": i, "part": name}} header/footer references in place
+    for sec in sections:
+        if not isinstance(sec, dict):
+            continue
+        for htype, blocks in list(sec.items()):
+            if isinstance(blocks, dict) and "same_as" in blocks:
+                ref = blocks["same_as"]
+                sec[htype] = sections[ref["section"]].get(ref["part"], [])
+
+# --- DOCX->JSON result cache ---
+# Results are keyed by the SHA-256 of the uploaded bytes plus the engine and
+# extraction options. A bounded in-memory LRU sits in front of an on-disk tier of
+# JSON files that is evicted by size like the image store. Disk entries are written
+# behind the request by a background thread, so a miss only touches memory. Bump
+# RESULT_CACHE_VERSION whenever the extraction output changes.
+RESULT_CACHE_VERSION = 3
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'docgen_results'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+RESULT_CACHE_MEMORY_ITEMS = int(os.environ.get('RESULT_CACHE_MEMORY_ITEMS', 32))
+# Results waiting to be written to disk; further misses skip the disk tier while it is
+# full. 0 or less turns off disk writes (entries already on disk are still read).
+RESULT_CACHE_WRITE_QUEUE = int(os.environ.get('RESULT_CACHE_WRITE_QUEUE', 64))
+_result_cache_lock = threading.Lock()
+_result_cache_memory = OrderedDict()  # key -> result, least recently used first
+_result_cache_index = None  # file name -> size, least recently used first
+_result_cache_bytes = 0
+result_cache_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "disk_writes_skipped": 0}
+_result_cache_writes = queue.Queue(max(RESULT_CACHE_WRITE_QUEUE, 1))  # Queue(0) would be unbounded
+_result_cache_writer = None
+
+def result_cache_key(digest, engine, options):
+    # digest is the docx_digest of the source
+    # frozenset projections serialise as sorted lists
+    settings = json.dumps({"version": RESULT_CACHE_VERSION, "engine": engine, "options": options or {}},
+                          sort_keys=True, default=sorted)
+    return hashlib.sha256(f"{digest}:{settings}".encode()).hexdigest()
+
+def _load_result_cache_index():
+    global _result_cache_index, _result_cache_bytes
+    if _result_cache_index is None:
+        _result_cache_index = load_file_lru(RESULT_CACHE_DIR)
+        _result_cache_bytes = sum(_result_cache_index.values())
+        _result_cache_bytes = evict_file_lru(RESULT_CACHE_DIR, _result_cache_index, _result_cache_bytes, RESULT_CACHE_MAX_BYTES)
+    return _result_cache_index
+
+def _images_still_stored(result):
+    # A cached images=store result is only usable while its image files are in the store
+    return all(os.path.exists(os.path.join(IMAGE_STORE_DIR, img["path"])) for img in result.get("images", []))
+
+def result_cache_get(key):
+    """Return (result, "memory" | "disk") for a cached key, or (None, "miss")."""
+    filename = f"{key}.json"
+    path = os.path.join(RESULT_CACHE_DIR, filename)
+    with _result_cache_lock:
+        result = _result_cache_memory.get(key)
+        if result is not None and _images_still_stored(result):
+            _result_cache_memory.move_to_end(key)
+            result_cache_stats["memory_hits"] += 1
+            return result, "memory"
+        on_disk = RESULT_CACHE_MAX_BYTES > 0 and filename in _load_result_cache_index()
+    result = None
+    if on_disk:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            result = None
+    with _result_cache_lock:
+        if result is not None and _images_still_stored(result):
+            if filename in _result_cache_index:
+                _result_cache_index.move_to_end(filename)
+            _remember_result(key, result)
+            result_cache_stats["disk_hits"] += 1
+            return result, "disk"
+        result_cache_stats["misses"] += 1
+    return None, "miss"
+
+def _remember_result(key, result):
+    # Called with _result_cache_lock held
+    if RESULT_CACHE_MEMORY_ITEMS <= 0:
+        return
+    _result_cache_memory[key] = result
+    _result_cache_memory.move_to_end(key)
+    while len(_result_cache_memory) > RESULT_CACHE_MEMORY_ITEMS:
+        _result_cache_memory.popitem(last=False)
+
+def result_cache_put(key, result):
+    global _result_cache_writer
+    with _result_cache_lock:
+        _remember_result(key, result)
+        if RESULT_CACHE_MAX_BYTES <= 0:
+            return
+        if RESULT_CACHE_WRITE_QUEUE <= 0:
+            result_cache_stats["disk_writes_skipped"] += 1
+            return
+        if _result_cache_writer is None:
+            _result_cache_writer = threading.Thread(target=_write_result_cache, name="result-cache-writer", daemon=True)
+            _result_cache_writer.start()
+        try:
+            _result_cache_writes.put_nowait((key, result))
+        except queue.Full:
+            result_cache_stats["disk_writes_skipped"] += 1
+
+def _write_result_cache():
+    # Background writer for the disk tier; results are shared read-only, so they can be
+    # serialised here after the request has been answered
+    global _result_cache_bytes
+    while True:
+        key, result = _result_cache_writes.get()
+        try:
+            data = json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            filename = f"{key}.json"
+            path = os.path.join(RESULT_CACHE_DIR, filename)
+            with _result_cache_lock:
+                index = _load_result_cache_index()
+            # File I/O happens outside the lock so requests hitting the memory tier never
+            # wait on the disk; this thread is the only writer, so nothing else adds files
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with _result_cache_lock:
+                _result_cache_bytes += len(data) - index.pop(filename, 0)
+                index[filename] = len(data)
+                victims, _result_cache_bytes = pick_file_lru_victims(index, _result_cache_bytes, RESULT_CACHE_MAX_BYTES)
+            remove_files(RESULT_CACHE_DIR, victims)
+        except Exception as e:
+            print(f"[_write_result_cache] Could not write {key}: {e}")
+        finally:
+            _result_cache_writes.task_done()
+
+def get_result_cache_stats():
+    with _result_cache_lock:
+        stats = dict(result_cache_stats)
+        stats["memory_entries"] = len(_result_cache_memory)
+        stats["disk_entries"] = len(_result_cache_index or {})
+        stats["disk_bytes"] = _result_cache_bytes
+        stats["disk_writes_pending"] = _result_cache_writes.qsize()
+    return stats
+
+def document_context(doc):
+    # The styles and relationships of an opened Document, as open_stream_context reads them
+    style_names, default_style = paragraph_style_names(doc.styles.element)
+    rels = {rId: (rel.reltype, rel.target_ref if rel.is_external else rel.target_part.partname.lstrip("/"))
+            for rId, rel in doc.part.rels.items()}
+    return {"style_names": style_names, "default_style": default_style, "rels": rels}
+
+def extraction_context(ctx, engine, options):
+    # What shapes every block besides its XML and the styles and relationships it refers
+    # to (see element_digest): the engine, the options and the default paragraph style
+    settings = repr((engine, json.dumps(options or {}, sort_keys=True, default=sorted), ctx["default_style"]))
+    return hashlib.sha256(settings.encode()).hexdigest()
+
+def with_changes(result, revision, entry, previous):
+    changed, removed = changed_blocks(entry, previous)
+    return {**result, "revision": revision, "changed": changed, "removed": removed}
+
+def extract_docx_json(docx_path, engine=None, options=None, since=None, record=False):
+    """Extract the DOCX->JSON result, reusing a cached result for the same bytes and options.
+
+    docx_path is a path or a seekable binary file object (see DOCX sources).
+
+    Returns (result, "memory" | "disk" | "miss", revision). With since=<earlier revision>,
+    body blocks unchanged since that revision are reused rather than re-extracted and the
+    result also lists the changed and removed block indices. Block hashes are only
+    recorded, so that the revision can serve as a later `since`, with since or record.
+    Cached results are shared, so callers must not modify them.
+    """
+    engine = engine or EXTRACT_ENGINE
+    digest = docx_digest(docx_path)
+    key = result_cache_key(digest, engine, options)
+    text_mode = options and options.get("mode") == "text"
+    track = (since is not None or record) and not text_mode
+    result, tier = result_cache_get(key)
+    if result is not None:
+        if not track:
+            return result, tier, key
+        entry = get_revision(key)
+        if entry is not None:
+            if since is None:
+                return result, tier, key
+            return with_changes(result, key, entry, get_revision(since)), tier, key
+    previous = get_revision(since) if since else None
+    memo = new_block_memo(previous) if track else None
+    image_prefix = source_image_prefix(docx_path, digest)
+    if text_mode:
+        result = extract_text(docx_path)
+    elif engine == "stream":
+        result = stream_extract_all_sections(docx_path, options, image_prefix, memo)
+    else:
+        doc = Document(docx_path)
+        if memo is not None:
+            set_memo_context(memo, document_context(doc), engine, options)
+
+        # Extract document sections (including headers/footers, and images when requested)
+        result = extract_all_sections(doc, None, image_prefix, options, memo)
+    if options and options.get("schema") == "compact" and not text_mode:
+        result = compact_result(result)
+    result_cache_put(key, result)
+    if memo is not None:
+        record_revision(key, memo)
+        if since:
+            return with_changes(result, key, memo, previous), "miss", key
+    return result, "miss", key
+
+# --- Wire formats ---
+# Request and response bodies of the API can be JSON (the default), MessagePack or
+# CBOR, negotiated through Accept / Content-Type; all three carry the same block
+# schema. JSON is written compactly, through orjson when it is available.
+MEDIA_JSON = "application/json"
+MEDIA_MSGPACK = "application/msgpack"
+MEDIA_CBOR = "application/cbor"
+MEDIA_ALIASES = {"application/x-msgpack": MEDIA_MSGPACK, "application/vnd.msgpack": MEDIA_MSGPACK}
+
+def wire_formats():
+    """Media types the server can currently read and write, in order of preference."""
+    formats = [MEDIA_JSON]
+    if msgpack is not None:
+        formats.append(MEDIA_MSGPACK)
+    if cbor2 is not None:
+        formats.append(MEDIA_CBOR)
+    return formats
+
+def negotiate_media_type(accept_mimetypes):
+    # Best supported match for a werkzeug Accept header, JSON when nothing matches
+    formats = wire_formats()
+    offers = formats + [alias for alias, media_type in MEDIA_ALIASES.items() if media_type in formats]
+    best = accept_mimetypes.best_match(offers, default=MEDIA_JSON)
+    return MEDIA_ALIASES.get(best, best)
+
+def encode_json(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def encode_body(data, media_type):
+    if media_type == MEDIA_MSGPACK:
+        return msgpack.packb(data, use_bin_type=True)
+    if media_type == MEDIA_CBOR:
+        return cbor2.dumps(data)
+    return encode_json(data)
+
+def decode_body(raw, media_type):
+    media_type = MEDIA_ALIASES.get(media_type, media_type)
+    if media_type == MEDIA_MSGPACK:
+        return msgpack.unpackb(raw, raw=False)
+    if media_type == MEDIA_CBOR:
+        return cbor2.loads(raw)
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+# --- Response compression ---
+# API responses are compressed with zstd, brotli or gzip, whichever the client
+# accepts (in that order of preference), unless they are known to be smaller than
+# COMPRESSION_MIN_BYTES. The body is compressed chunk by chunk as it is sent, so
+# DOCX downloads are never buffered whole. Bodies of unknown length (NDJSON streams)
+# are flushed after every chunk, so each block reaches the client as it is produced.
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+COMPRESSION_LEVELS = {
+    "zstd": int(os.environ.get('ZSTD_LEVEL', 3)),
+    "br": int(os.environ.get('BROTLI_LEVEL', 5)),
+    "gzip": int(os.environ.get('GZIP_LEVEL', 6)),
+}
+COMPRESSIBLE_TYPES = {
+    MEDIA_JSON, MEDIA_MSGPACK, MEDIA_CBOR, "application/x-ndjson",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+_compression_lock = threading.Lock()
+compression_stats = {}  # codec -> {"responses", "bytes_in", "bytes_out"}
+
+def compression_codecs():
+    codecs = []
+    if zstandard is not None:
+        codecs.append("zstd")
+    if brotli is not None:
+        codecs.append("br")
+    codecs.append("gzip")
+    return codecs
+
+def choose_compression(accept_encodings, response):
+    """Codec to compress `response` with for a werkzeug Accept-Encoding header, or None."""
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return None
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return None
+    length = response.content_length
+    if length is not None and length < COMPRESSION_MIN_BYTES:
+        return None
+    return accept_encodings.best_match(compression_codecs())
+
+def new_compressor(codec):
+    # (compress(chunk), flush(), finish()) -> bytes for a streaming compressor; flush()
+    # emits everything compressed so far without ending the stream
+    level = COMPRESSION_LEVELS[codec]
+    if codec == "zstd":
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        return compressor.compress, lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+    if codec == "br":
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+def compress_chunks(chunks, codec, flush_chunks=False):
+    """Compress an iterable of byte chunks as it is consumed, recording the savings.
+
+    With flush_chunks, each chunk's compressed bytes are emitted before the next chunk
+    is read, at some cost in ratio, instead of whenever the compressor's buffer fills.
+    """
+    compress, flush, finish = new_compressor(codec)
+    bytes_in = bytes_out = 0
+    try:
+        for chunk in chunks:
+            bytes_in += len(chunk)
+            out = compress(chunk)
+            if flush_chunks:
+                out += flush()
+            if out:
+                bytes_out += len(out)
+                yield out
+        out = finish()
+        bytes_out += len(out)
+        yield out
+    finally:
+        with _compression_lock:
+            stats = compression_stats.setdefault(codec, {"responses": 0, "bytes_in": 0, "bytes_out": 0})
+            stats["responses"] += 1
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+
+def get_compression_stats():
+    with _compression_lock:
+        return {codec: dict(stats, bytes_saved=stats["bytes_in"] - stats["bytes_out"])
+                for codec, stats in compression_stats.items()}
+
+def write_sections(doc, sections, temp_dir, write_blocks):
+    """Create the sections of a JSON document and write their headers and footers."""
+    # Set up sections in the DOCX to match JSON
+    num_json_sections = len(sections)
+    # python-docx always starts with one section
+    while len(doc.sections) < num_json_sections:
+        doc.add_section()
+    for idx, section_json in enumerate(sections):
+        section = doc.sections[idx]
+        # Determine what to use for first page header
+        first_page_header_blocks = section_json.get('first_page_header')
+        header_blocks = section_json.get('header')
+        even_page_header_blocks = section_json.get('even_page_header')
+        # Set section flags
+        section.different_first_page_header_footer = bool(first_page_header_blocks or header_blocks)
+        section.different_even_page_header_footer = bool(even_page_header_blocks)
+        # Add first page header: prefer explicit first_page_header, else fallback to header
+        if section.different_first_page_header_footer:
+            if first_page_header_blocks and any(b for b in first_page_header_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
+                part = getattr(section, 'first_page_header', None)
+                if part:
+                    print(f"[write_sections] Writing {len(first_page_header_blocks)} blocks to first_page_header of section {idx}")
+                    part.is_header = True
+                    write_blocks(part, first_page_header_blocks, temp_dir)
+            elif header_blocks and any(b for b in header_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
+                part = getattr(section, 'first_page_header', None)
+                if part:
+                    print(f"[write_sections] Writing {len(header_blocks)} blocks to first_page_header (from 'header') of section {idx}")
+                    part.is_header = True
+                    write_blocks(part, header_blocks, temp_dir)
+        # Add regular header for subsequent pages: only if header exists
+        if header_blocks and any(b for b in header_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
+            part = getattr(section, 'header', None)
+            if part:
+                print(f"[write_sections] Writing {len(header_blocks)} blocks to header of section {idx}")
+                part.is_header = True
+                write_blocks(part, header_blocks, temp_dir)
+        # Add even page header if configured
+        if section.different_even_page_header_footer and even_page_header_blocks and any(b for b in even_page_header_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
+            part = getattr(section, 'even_page_header', None)
+            if part:
+                print(f"[write_sections] Writing {len(even_page_header_blocks)} blocks to even_page_header of section {idx}")
+                part.is_header = True
+                write_blocks(part, even_page_header_blocks, temp_dir)
+        # Footers: similar logic
+        first_page_footer_blocks = section_json.get('first_page_footer')
+        footer_blocks = section_json.get('footer')
+        even_page_footer_blocks = section_json.get('even_page_footer')
+        # Add first page footer: prefer explicit first_page_footer, else fallback to footer
+        if section.different_first_page_header_footer:
+            if first_page_footer_blocks and any(b for b in first_page_footer_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
+                part = getattr(section, 'first_page_footer', None)
+                if part:
+                    print(f"[write_sections] Writing {len(first_page_footer_blocks)} blocks to first_page_footer of section {idx}")
+                    part.is_footer = True
+                    write_blocks(part, first_page_footer_blocks, temp_dir)
+            elif footer_blocks and any(b for b in footer_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
+                part = getattr(section, 'first_page_footer', None)
+                if part:
+                    print(f"[write_sections] Writing {len(footer_blocks)} blocks to first_page_footer (from 'footer') of section {idx}")
+                    part.is_footer = True
+                    write_blocks(part, footer_blocks, temp_dir)
+        # Add regular footer for subsequent pages: only if footer exists
+        if footer_blocks and any(b for b in footer_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
+            part = getattr(section, 'footer', None)
+            if part:
+                print(f"[write_sections] Writing {len(footer_blocks)} blocks to footer of section {idx}")
+                part.is_footer = True
+                write_blocks(part, footer_blocks, temp_dir)
+        # Add even page footer if configured
+        if section.different_even_page_header_footer and even_page_footer_blocks and any(b for b in even_page_footer_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
+            part = getattr(section, 'even_page_footer', None)
+            if part:
+                print(f"[write_sections] Writing {len(even_page_footer_blocks)} blocks to even_page_footer of section {idx}")
+                part.is_footer = True
+                write_blocks(part, even_page_footer_blocks, temp_dir)
+
+def is_header_block(block):
+    # Heuristic: level-1 headings, or blocks explicitly marked as header content
+    return (block.get('type') == 'heading' and block.get('level', 1) == 1) or bool(block.get('in_header'))
+
+def move_header_blocks(doc_json):
+    # Header-like body blocks move to the first section's header when it has none,
+    # for round-trip fidelity of documents whose header was flattened into 'blocks'
+    blocks = doc_json.get('blocks', [])
+    sections = doc_json.get('sections', [])
+    # Only process if blocks exist and sections exist
+    if blocks and isinstance(sections, list) and len(sections) > 0:
+        header_blocks = [block for block in blocks if is_header_block(block)]
+        first_section = sections[0]
+        if header_blocks and not first_section.get('header'):
+            first_section['header'] = header_blocks
+            doc_json['blocks'] = [block for block in blocks if not is_header_block(block)]
+            print(f"[move_header_blocks] Moved {len(header_blocks)} blocks from body to header of first section.")
+
+# --- Streaming JSON ingestion ---
+# JSON->DOCX without holding the whole JSON document in memory. With ijson installed the
+# body is read incrementally: a first pass over the parse events keeps only the small
+# values needed before the body (schema, styles and sections), then the body blocks are
+# parsed one at a time and handed to the block writer as they are read.
+JSON_LAYOUT_KEYS = ("schema", "styles", "sections")
+JSON_SPOOL_CHUNK = 1024 * 1024
+# Request bodies and uploads are buffered in memory up to this size, on disk above it
+SPOOL_MEMORY_BYTES = int(os.environ.get('SPOOL_MEMORY_BYTES', 16 * 1024 * 1024))
+
+def scan_json_layout(f):
+    """The keys of a JSON file's top-level object and of its "document" object, each
+    with the parse event its value starts with, and the values of JSON_LAYOUT_KEYS."""
+    kinds = {"": {}, "document": {}}
+    values = {"": {}, "document": {}}
+    pending = None
+    builder = None
+    f.seek(0)
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth == 0:
+                values[parent][key] = builder.value
+                builder = None
+        elif pending is not None:
+            parent, key = pending
+            pending = None
+            kinds[parent][key] = event
+            if key in JSON_LAYOUT_KEYS:
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                depth = 1 if event in ("start_map", "start_array") else 0
+                if depth == 0:
+                    values[parent][key] = builder.value
+                    builder = None
+        elif event == "map_key" and prefix in kinds:
+            pending = (prefix, value)
+    return kinds, values
+
+def iter_json_blocks(f, prefix, styles=None, skip=()):
+    # Blocks of the array at prefix, parsed one at a time (compact ones expanded)
+    f.seek(0)
+    for i, block in enumerate(ijson.items(f, prefix + ".item", use_float=True)):
+        if i in skip:
+            continue
+        if styles is not None:
+            expand_blocks([block], styles)
+        yield block
+
+def stream_json_document(f, image_dir, engine=None, move_headers=False):
+    """Build the document for a seekable JSON file object while parsing it, as
+    json_to_document would for the parsed JSON.
+
+    Returns None without building anything when the file is not laid out the way this
+    needs (an object with a non-empty sections list); the caller then loads it whole.
+    """
+    try:
+        kinds, values = scan_json_layout(f)
+    except ijson.JSONError:
+        return None  # e.g. integers beyond 64 bits, which are left to the json module
+    # If the document is wrapped in a 'document' key, unwrap it
+    root = "document" if "document" in kinds[""] else ""
+    if root and kinds[""]["document"] != "start_map":
+        return None
+    kinds, values = kinds[root], values[root]
+    prefix = root + "." if root else ""
+    sections = values.get("sections")
+    if not isinstance(sections, list) or not sections:
+        return None
+    moved = set()
+    if move_headers and kinds.get("blocks") not in (None, "null"):
+        # move_header_blocks, keeping only the blocks that move in memory
+        if kinds["blocks"] != "start_array" or not isinstance(sections[0], dict):
+            return None
+        header_blocks = []
+        for i, block in enumerate(iter_json_blocks(f, prefix + "blocks")):
+            if is_header_block(block):
+                header_blocks.append(block)
+                moved.add(i)
+        if header_blocks and not sections[0].get('header'):
+            sections[0]['header'] = header_blocks
+            print(f"[stream_json_document] Moved {len(header_blocks)} blocks from body to header of first section.")
+        else:
+            moved = set()
+    styles = None
+    if values.get("schema") == "compact":
+        styles = values.get("styles", [])
+        for sec in sections:
+            if isinstance(sec, dict):
+                for blocks in sec.values():
+                    expand_blocks(blocks, styles)
+    resolve_section_refs(sections)
+
+    write_blocks = block_writer(engine)
+    doc = new_document()
+    write_sections(doc, sections, image_dir, write_blocks)
+    # Add body content
+    if kinds.get("body") == "start_array":
+        write_blocks(doc, iter_json_blocks(f, prefix + "body", styles), image_dir)
+    elif kinds.get("blocks") == "start_array":
+        write_blocks(doc, iter_json_blocks(f, prefix + "blocks", styles, moved), image_dir)
+    return doc
+
+def json_to_document(data, image_dir, engine=None):
+    """Build the document for parsed JSON, or return None if it has no sections."""
+    # If the document is wrapped in a 'document' key, unwrap it
+    if 'document' in data:
+        data = data['document']
+    expand_compact(data)
+    if isinstance(data.get('sections'), list):
+        resolve_section_refs(data['sections'])
+    if not ('sections' in data and isinstance(data['sections'], list) and len(data['sections']) > 0):
+        return None
+    write_blocks = block_writer(engine)
+    doc = new_document()
+    # Restore sections, headers, and footers
+    write_sections(doc, data['sections'], image_dir, write_blocks)
+    # Add body content
+    if 'body' in data and isinstance(data['body'], list):
+        write_blocks(doc, data['body'], image_dir)
+    elif 'blocks' in data and isinstance(data['blocks'], list):
+        write_blocks(doc, data['blocks'], image_dir)
+    return doc
+
+def document_counts(doc):
+    # Body-level paragraphs and tables of a built document, as doc.paragraphs/doc.tables count them
+    body = doc.element.body
+    return len(body.p_lst), len(body.tbl_lst)
+
+def convert_document(doc_file, target_format, engine=None, options=None):
     """Convert a document to the target format"""
     # Get file path from the uploaded file
     if hasattr(doc_file, 'name'):
@@ -502,16 +2567,11 @@ def convert_document(doc_file, target_format):
     # Handle DOCX to JSON conversion
     if file_ext == '.docx' and target_format.lower() == 'json':
         # Extract document structure to JSON
-        doc = Document(orig_file_path)
-        temp_dir = tempfile.mkdtemp()
-        image_prefix = hashlib.md5(orig_file_path.encode()).hexdigest()
-
-        # Extract document sections (including headers/footers)
-        result = extract_all_sections(doc, temp_dir, image_prefix)
+        result, _, _ = extract_docx_json(orig_file_path, engine, options)
 
         # Save JSON (no flattening, no duplication)
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        with open(output_file, 'wb') as f:
+            f.write(encode_json(result))
 
         input_preview = get_preview(orig_file_path)
         output_preview = get_preview(output_file)
@@ -519,99 +2579,17 @@ def convert_document(doc_file, target_format):
     
     # Handle JSON to DOCX conversion
     if file_ext == '.json' and target_format.lower() == 'docx':
-        # Create a new document from JSON
-        with open(orig_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        doc = Document()
         temp_dir = os.path.dirname(orig_file_path)
-
-        # If the document is wrapped in a 'document' key, unwrap it
-        if 'document' in data:
-            data = data['document']
-
-        # Restore sections, headers, and footers if present
-        header_fallback_blocks = []
-        if 'sections' in data and isinstance(data['sections'], list) and len(data['sections']) > 0:
-            # Set up sections in the DOCX to match JSON
-            num_json_sections = len(data['sections'])
-            # python-docx always starts with one section
-            while len(doc.sections) < num_json_sections:
-                doc.add_section()
-            for idx, section_json in enumerate(data['sections']):
-                section = doc.sections[idx]
-                # Determine what to use for first page header
-                first_page_header_blocks = section_json.get('first_page_header')
-                header_blocks = section_json.get('header')
-                even_page_header_blocks = section_json.get('even_page_header')
-                # Set section flags
-                section.different_first_page_header_footer = bool(first_page_header_blocks or header_blocks)
-                section.different_even_page_header_footer = bool(even_page_header_blocks)
-                # Add first page header: prefer explicit first_page_header, else fallback to header
-                if section.different_first_page_header_footer:
-                    if first_page_header_blocks and any(b for b in first_page_header_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
-                        part = getattr(section, 'first_page_header', None)
-                        if part:
-                            print(f"[convert_document] Writing {len(first_page_header_blocks)} blocks to first_page_header of section {idx}")
-                            part.is_header = True
-                            add_blocks_to_doc(part, first_page_header_blocks, temp_dir)
-                    elif header_blocks and any(b for b in header_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
-                        part = getattr(section, 'first_page_header', None)
-                        if part:
-                            print(f"[convert_document] Writing {len(header_blocks)} blocks to first_page_header (from 'header') of section {idx}")
-                            part.is_header = True
-                            add_blocks_to_doc(part, header_blocks, temp_dir)
-                # Add regular header for subsequent pages: only if header exists
-                if header_blocks and any(b for b in header_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
-                    part = getattr(section, 'header', None)
-                    if part:
-                        print(f"[convert_document] Writing {len(header_blocks)} blocks to header of section {idx}")
-                        part.is_header = True
-                        add_blocks_to_doc(part, header_blocks, temp_dir)
-                # Add even page header if configured
-                if section.different_even_page_header_footer and even_page_header_blocks and any(b for b in even_page_header_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
-                    part = getattr(section, 'even_page_header', None)
-                    if part:
-                        print(f"[convert_document] Writing {len(even_page_header_blocks)} blocks to even_page_header of section {idx}")
-                        part.is_header = True
-                        add_blocks_to_doc(part, even_page_header_blocks, temp_dir)
-                # Footers: similar logic
-                first_page_footer_blocks = section_json.get('first_page_footer')
-                footer_blocks = section_json.get('footer')
-                even_page_footer_blocks = section_json.get('even_page_footer')
-                # Add first page footer: prefer explicit first_page_footer, else fallback to footer
-                if section.different_first_page_header_footer:
-                    if first_page_footer_blocks and any(b for b in first_page_footer_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
-                        part = getattr(section, 'first_page_footer', None)
-                        if part:
-                            print(f"[convert_document] Writing {len(first_page_footer_blocks)} blocks to first_page_footer of section {idx}")
-                            part.is_footer = True
-                            add_blocks_to_doc(part, first_page_footer_blocks, temp_dir)
-                    elif footer_blocks and any(b for b in footer_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
-                        part = getattr(section, 'first_page_footer', None)
-                        if part:
-                            print(f"[convert_document] Writing {len(footer_blocks)} blocks to first_page_footer (from 'footer') of section {idx}")
-                            part.is_footer = True
-                            add_blocks_to_doc(part, footer_blocks, temp_dir)
-                # Add regular footer for subsequent pages: only if footer exists
-                if footer_blocks and any(b for b in footer_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
-                    part = getattr(section, 'footer', None)
-                    if part:
-                        print(f"[convert_document] Writing {len(footer_blocks)} blocks to footer of section {idx}")
-                        part.is_footer = True
-                        add_blocks_to_doc(part, footer_blocks, temp_dir)
-                # Add even page footer if configured
-                if section.different_even_page_header_footer and even_page_footer_blocks and any(b for b in even_page_footer_blocks if b.get('type') != 'paragraph' or b.get('runs', []) or b.get('type') == 'table'):
-                    part = getattr(section, 'even_page_footer', None)
-                    if part:
-                        print(f"[convert_document] Writing {len(even_page_footer_blocks)} blocks to even_page_footer of section {idx}")
-                        part.is_footer = True
-                        add_blocks_to_doc(part, even_page_footer_blocks, temp_dir)
-            # Add body content
-            if 'body' in data and isinstance(data['body'], list):
-                add_blocks_to_doc(doc, data['body'], temp_dir)
-            elif 'blocks' in data and isinstance(data['blocks'], list):
-                add_blocks_to_doc(doc, data['blocks'], temp_dir)
+        doc = None
+        with open(orig_file_path, 'rb') as f:
+            # Parse incrementally when ijson is installed, so large files are never loaded whole
+            if ijson is not None:
+                doc = stream_json_document(f, temp_dir, engine)
+            if doc is None:
+                # Create a new document from JSON
+                f.seek(0)
+                doc = json_to_document(decode_body(f.read(), MEDIA_JSON), temp_dir, engine)
+        if doc is not None:
             doc.save(output_file)
             input_preview = get_preview(orig_file_path)
             output_preview = get_preview(output_file)
@@ -639,19 +2617,10 @@ def convert_document(doc_file, target_format):
             print(error_msg)
             return error_msg, None, None
 
-def parity_check(docx_path):
-    import tempfile
+def parity_check(docx_path, write_engine=None):
     print(f"[Parity Check] Testing round-trip for: {docx_path}")
     class FileLike:  # Fake file-like for CLI
         def __init__(self, name): self.name = name
-    _, _, json_out = convert_document(FileLike(docx_path), 'json')
-    if not json_out or not os.path.exists(json_out):
-        print("Failed to produce JSON from DOCX.")
-        return False
-    _, _, docx_out = convert_document(FileLike(json_out), 'docx')
-    if not docx_out or not os.path.exists(docx_out):
-        print("Failed to produce DOCX from JSON.")
-        return False
     def extract_all_sections_for_parity(docx_path):
         doc = Document(docx_path)
         sections = []
@@ -665,9 +2634,23 @@ def parity_check(docx_path):
             sections.append(sec)
         body = extract_blocks(doc, os.path.dirname(docx_path), os.path.splitext(os.path.basename(docx_path))[0])
         return {"sections": sections, "body": body}
-    orig = extract_all_sections_for_parity(docx_path)
-    roundtrip = extract_all_sections_for_parity(docx_out)
-    import difflib, pprint
+    # convert_document writes next to its input, so round-trip a copy in a scratch
+    # directory: the rebuilt DOCX must not overwrite the original it is compared to
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_path = os.path.join(work_dir, os.path.basename(docx_path))
+        shutil.copyfile(docx_path, work_path)
+        _, _, json_out = convert_document(FileLike(work_path), 'json')
+        if not json_out or not os.path.exists(json_out):
+            print("Failed to produce JSON from DOCX.")
+            return False
+        os.remove(work_path)
+        _, _, docx_out = convert_document(FileLike(json_out), 'docx', write_engine)
+        if not docx_out or not os.path.exists(docx_out):
+            print("Failed to produce DOCX from JSON.")
+            return False
+        orig = extract_all_sections_for_parity(docx_path)
+        roundtrip = extract_all_sections_for_parity(docx_out)
+    import pprint
     def blocks_to_str(blocks):
         return pprint.pformat(blocks, width=120)
     if orig == roundtrip:
@@ -688,12 +2671,13 @@ def parity_check(docx_path):
         return False
 
 if __name__ == "__main__":
-    if len(sys.argv) == 3 and sys.argv[1] == "--parity-check":
-        parity_check(sys.argv[2])
-        sys.exit(0)
+    if len(sys.argv) in (3, 4) and sys.argv[1] == "--parity-check":
+        # Optional third argument: the write engine for the JSON->DOCX leg
+        sys.exit(0 if parity_check(sys.argv[2], *sys.argv[3:]) else 1)
     
     # Create Flask app for API endpoints
     app = Flask(__name__)
+    app.request_class = SpooledRequest
     
     def check_api_key():
         """Check if the API key is valid."""
@@ -702,6 +2686,24 @@ if __name__ == "__main__":
             return False
         return True
     
+    @app.after_request
+    def compress_response(response):
+        codec = choose_compression(request.accept_encodings, response)
+        if codec is None:
+            return response
+        # Streamed bodies (no Content-Length) are flushed chunk by chunk
+        response.response = compress_chunks(response.iter_encoded(), codec, response.content_length is None)
+        response.direct_passthrough = False
+        response.headers.remove('Content-Length')
+        response.headers['Content-Encoding'] = codec
+        response.vary.add('Accept-Encoding')
+        return response
+    
+    def respond(data):
+        """Encode a response body in the format the client asked for in Accept."""
+        media_type = negotiate_media_type(request.accept_mimetypes)
+        return Response(encode_body(data, media_type), mimetype=media_type)
+    
     @app.route('/', methods=['GET'])
     def index():
         """Index route to check if the API is running."""
@@ -817,6 +2819,28 @@ if __name__ == "__main__":
         if not check_api_key():
             return jsonify({"error": "Invalid or missing API key"}), 401
             
+        # Paging: offset/limit extract a block range, cursor continues an earlier upload
+        cursor = request.args.get('cursor')
+        paged = cursor is not None or 'offset' in request.args or 'limit' in request.args
+        try:
+            offset = int(request.args['offset']) if 'offset' in request.args else None
+            limit = int(request.args.get('limit', 50))
+        except ValueError:
+            return jsonify({"error": "offset and limit must be integers"}), 400
+        if (offset is not None and offset < 0) or limit < 1:
+            return jsonify({"error": "offset must be >= 0 and limit >= 1"}), 400
+        if paged and request.args.get('stream'):
+            return jsonify({"error": "stream cannot be combined with offset, limit or cursor"}), 400
+        if request.args.get('mode') == 'text' and (paged or request.args.get('stream')):
+            return jsonify({"error": "mode=text cannot be combined with stream, offset, limit or cursor"}), 400
+        if request.args.get('schema') == 'compact' and (paged or request.args.get('stream')):
+            return jsonify({"error": "schema=compact cannot be combined with stream, offset, limit or cursor"}), 400
+        if cursor is not None:
+            page = extract_page(cursor, offset, limit)
+            if page is None:
+                return jsonify({"error": "Unknown or expired cursor"}), 404
+            return respond(page)
+        
         if 'file' not in request.files:
             return jsonify({"error": "No file part"}), 400
         
@@ -827,87 +2851,118 @@ if __name__ == "__main__":
         if not file.filename.lower().endswith('.docx'):
             return jsonify({"error": "File must be a DOCX document"}), 400
         
-        # Save the uploaded file
-        temp_dir = tempfile.mkdtemp()
-        file_path = os.path.join(temp_dir, file.filename)
-        file.save(file_path)
+        engine = request.args.get('engine', EXTRACT_ENGINE)
+        if engine not in ENGINES:
+            return jsonify({"error": f"Unknown engine '{engine}', expected one of {', '.join(ENGINES)}"}), 400
+        options, error = parse_extraction_options(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        stream_mode = request.args.get('stream')
+        if stream_mode not in (None, 'ndjson'):
+            return jsonify({"error": f"Unknown stream mode '{stream_mode}', expected 'ndjson'"}), 400
+        
+        # The upload is read where it is (see DOCX sources); nothing is saved to disk
+        if stream_mode == 'ndjson':
+            # Chunked response: blocks are written out as they are extracted
+            source = spool_upload(file)
+            def generate():
+                try:
+                    yield from iter_ndjson_lines(source, engine, options)
+                except Exception as e:
+                    yield encode_json({"error": str(e)}) + b"\n"
+                finally:
+                    source.close()
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        if paged:
+            try:
+                return respond(extract_page(open_page_handle(spool_upload(file), engine, options), offset or 0, limit))
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
         
         try:
-            # Convert to JSON
-            _, _, json_path = convert_document(type('obj', (object,), {'name': file_path}), "json")
-            
-            if not json_path or not os.path.exists(json_path):
-                return jsonify({"error": "Error converting document to JSON"}), 500
-            
-            # Read JSON content
-            with open(json_path, "r", encoding="utf-8") as f:
-                json_content = json.load(f)
-            
-            return jsonify(json_content)
+            # Convert to JSON (repeat uploads are served from the result cache)
+            json_content, cache_status, revision = extract_docx_json(file.stream, engine, options, request.args.get('since'),
+                                                                         request.args.get('revision') == '1')
+            response = respond(json_content)
+            response.headers['X-Cache'] = cache_status
+            response.headers['X-Revision'] = revision
+            return response
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
+    @app.route('/api/cache-stats', methods=['GET'])
+    def api_cache_stats():
+        # Check API key
+        if not check_api_key():
+            return jsonify({"error": "Invalid or missing API key"}), 401
+        return jsonify(get_result_cache_stats())
+    
+    @app.route('/api/metrics', methods=['GET'])
+    def api_metrics():
+        # Check API key
+        if not check_api_key():
+            return jsonify({"error": "Invalid or missing API key"}), 401
+        return jsonify({"cache": get_result_cache_stats(), "compression": get_compression_stats()})
+    
     @app.route('/api/json-to-docx', methods=['POST'])
     def api_json_to_docx():
         # Check API key
         if not check_api_key():
             return jsonify({"error": "Invalid or missing API key"}), 401
             
-        if not request.is_json:
-            return jsonify({"error": "Request must be JSON"}), 400
+        content_type = MEDIA_ALIASES.get(request.mimetype, request.mimetype)
+        if content_type in (MEDIA_MSGPACK, MEDIA_CBOR):
+            if content_type not in wire_formats():
+                return jsonify({"error": f"{content_type} is not supported by this server"}), 415
+        elif not request.is_json:
+            return jsonify({"error": "Request must be JSON, MessagePack or CBOR"}), 400
+        engine = request.args.get('engine', WRITE_ENGINE)
+        if engine not in WRITE_ENGINES:
+            return jsonify({"error": f"Unknown engine '{engine}', expected one of {', '.join(WRITE_ENGINES)}"}), 400
         
         try:
-            # Save the JSON to a temporary file
-            temp_dir = tempfile.mkdtemp()
-            json_path = os.path.join(temp_dir, "document.json")
+            # Build the document in memory. Image blocks refer to the shared image store,
+            # since a request carries no files of its own
+            doc = None
+            if content_type not in (MEDIA_MSGPACK, MEDIA_CBOR) and ijson is not None:
+                # Parse the body while building the document, so it is never held as objects
+                # as a whole; bodies past SPOOL_MEMORY_BYTES are buffered on disk instead
+                with tempfile.SpooledTemporaryFile(SPOOL_MEMORY_BYTES) as body:
+                    shutil.copyfileobj(request.stream, body, JSON_SPOOL_CHUNK)
+                    print(f"[api_json_to_docx] Received {body.tell()} bytes of JSON")
+                    doc = stream_json_document(body, IMAGE_STORE_DIR, engine, move_headers=True)
+                    if doc is None:
+                        body.seek(0)
+                        raw = body.read()
+            else:
+                raw = request.get_data()
             
-            # Log incoming JSON
-            print("[api_json_to_docx] Received JSON:", request.json)
-            incoming_json = request.json
-            # --- Begin header auto-move logic for round-trip fidelity ---
-            # If 'document' in JSON, operate on that
-            doc_json = incoming_json.get('document', incoming_json)
-            # If header content is present in body blocks, move to header
-            if isinstance(doc_json, dict):
-                blocks = doc_json.get('blocks', [])
-                sections = doc_json.get('sections', [])
-                # Only process if blocks exist and sections exist
-                if blocks and isinstance(sections, list) and len(sections) > 0:
-                    # Detect header-like blocks (e.g., heading at top, or blocks marked as header)
-                    header_blocks = []
-                    non_header_blocks = []
-                    for block in blocks:
-                        # Heuristic: heading at very top, or explicit marker
-                        if block.get('type') == 'heading' and block.get('level', 1) == 1:
-                            header_blocks.append(block)
-                        elif block.get('in_header'):
-                            header_blocks.append(block)
-                        else:
-                            non_header_blocks.append(block)
-                    # If we found header blocks and first section header is empty, move them
-                    first_section = sections[0] if len(sections) > 0 else None
-                    if header_blocks and first_section is not None and (not first_section.get('header')):
-                        first_section['header'] = header_blocks
-                        doc_json['blocks'] = non_header_blocks
-                        print(f"[api_json_to_docx] Moved {len(header_blocks)} blocks from body to header of first section.")
-            # --- End header auto-move logic ---
-            with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(incoming_json, f)
-        
-            # Convert to DOCX
-            _, _, docx_path = convert_document(type('obj', (object,), {'name': json_path}), "docx")
+            if doc is None:
+                # Log incoming JSON
+                incoming_json = decode_body(raw, content_type)
+                del raw
+                print("[api_json_to_docx] Received JSON:", incoming_json)
+                # If 'document' in JSON, operate on that
+                doc_json = incoming_json.get('document', incoming_json)
+                # If header content is present in body blocks, move to header
+                if isinstance(doc_json, dict):
+                    move_header_blocks(doc_json)
+                doc = json_to_document(incoming_json, IMAGE_STORE_DIR, engine)
             
-            # After conversion, check if DOCX exists and has content
-            if not docx_path or not os.path.exists(docx_path):
-                print("[api_json_to_docx] ERROR: DOCX file was not created.")
+            if doc is None:
+                print("[api_json_to_docx] ERROR: JSON has no sections to build a DOCX from.")
                 return jsonify({"error": "Error converting JSON to DOCX"}), 500
-            from docx import Document
-            doc = Document(docx_path)
-            num_paras = len(doc.paragraphs)
-            num_tables = len(doc.tables)
+            num_paras, num_tables = document_counts(doc)
             print(f"[api_json_to_docx] DOCX created: paragraphs={num_paras}, tables={num_tables}")
             
-            return send_file(docx_path, as_attachment=True, download_name="converted.docx")
+            output = io.BytesIO()
+            doc.save(output)
+            output.seek(0)
+            response = send_file(output, as_attachment=True, download_name="converted.docx")
+            response.headers['X-Paragraphs'] = str(num_paras)
+            response.headers['X-Tables'] = str(num_tables)
+            return response
         except Exception as e:
             print(f"[api_json_to_docx] Exception: {e}")
             return jsonify({"error": str(e)}), 500
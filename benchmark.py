@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the DOCX <-> JSON conversion code in app.py
+
+Usage:
+    python benchmark.py hyperlinks [--links 10000]
+    python benchmark.py paragraphs [--paragraphs 2000]
+    python benchmark.py text [--paragraphs 5000]
+    python benchmark.py runs [--paragraphs 1000] [file.docx ...]
+    python benchmark.py formats [--paragraphs 3000]
+    python benchmark.py write [--paragraphs 5000] [--runs 10]
+    python benchmark.py template [--tables 4]
+    python benchmark.py tables [--rows 2000] [--cols 20]
+    python benchmark.py rpr [--runs 20000]
+    python benchmark.py ingest [--paragraphs 20000] [--engine xml]
+    python benchmark.py pipeline [--paragraphs 50] [--engine xml]
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from docx import Document
+from docx.enum.text import WD_BREAK
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from lxml import etree
+
+import app
+
+REL_HYPERLINK = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink"
+
+def timed(func, *args, repeat=3):
+    """Run func(*args) `repeat` times and return (best seconds, last result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def add_hyperlink(paragraph, url, text):
+    rId = paragraph.part.relate_to(url, REL_HYPERLINK, is_external=True)
+    hyperlink = OxmlElement("w:hyperlink")
+    hyperlink.set(qn("r:id"), rId)
+    run = OxmlElement("w:r")
+    t = OxmlElement("w:t")
+    t.text = text
+    run.append(t)
+    hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+def build_linked_document(n_links):
+    """A document of legal-citation style paragraphs, one hyperlink per paragraph."""
+    doc = Document()
+    for i in range(n_links):
+        paragraph = doc.add_paragraph(f"See citation {i}, ")
+        add_hyperlink(paragraph, f"https://example.com/cases/{i}", f"Case {i}")
+        paragraph.add_run(" at 12.")
+    return doc
+
+def ancestor_scan_runs(paragraph):
+    # The previous hyperlink lookup inside extract_runs: two ancestor XPath scans per run
+    # plus a rels lookup, here over the same runs (hyperlink runs included)
+    runs = []
+    for run in app.iter_paragraph_runs(paragraph):
+        run_data = {"text": run.text}
+        r = run._element
+        if r.xpath("ancestor::w:hyperlink"):
+            parent_hyper = r.xpath("ancestor::w:hyperlink")[0]
+            rId = parent_hyper.get(qn("r:id"))
+            if rId:
+                try:
+                    run_data["hyperlink"] = paragraph.part.rels[rId].target_ref
+                except Exception:
+                    pass
+        runs.append(run_data)
+    return runs
+
+def extract_all_runs(doc, extract):
+    doc.part._hyperlink_targets = None  # rebuild the index on every repetition
+    return [extract(paragraph) for paragraph in doc.paragraphs]
+
+def indexed_runs(paragraph):
+    return app.extract_runs(paragraph, fields={"run": frozenset(["text", "hyperlink"])})
+
+def bench_hyperlinks(args):
+    doc = build_linked_document(args.links)
+    n_runs = sum(1 for _ in doc.part.element.iter(qn("w:r")))
+    print(f"Document: {args.links} hyperlinks, {n_runs} runs; extract_runs with fields=text,hyperlink")
+    old_time, old_runs = timed(extract_all_runs, doc, ancestor_scan_runs)
+    new_time, new_runs = timed(extract_all_runs, doc, indexed_runs)
+    assert old_runs == new_runs, "hyperlink index disagrees with ancestor scan"
+    assert sum("hyperlink" in run for runs in new_runs for run in runs) == args.links
+    print(f"  ancestor scan per run : {old_time * 1000:8.1f} ms")
+    print(f"  per-part index        : {new_time * 1000:8.1f} ms  ({old_time / new_time:.1f}x faster)")
+
+def build_paragraph_cases(n_paragraphs):
+    """One document per paragraph shape, each with `n_paragraphs` paragraphs."""
+    def plain(doc, i):
+        doc.add_paragraph(f"Plain paragraph {i} with a single run of text.")
+
+    def formatted(doc, i):
+        paragraph = doc.add_paragraph()
+        for j in range(6):
+            run = paragraph.add_run(f"run {j} ")
+            run.bold = j % 2 == 0
+            run.italic = j % 3 == 0
+
+    def numbered(doc, i):
+        paragraph = doc.add_paragraph(f"Numbered item {i}")
+        numPr = paragraph._p.get_or_add_pPr().get_or_add_numPr()
+        numPr.get_or_add_numId().val = 1
+        numPr.get_or_add_ilvl().val = 0
+
+    def annotated(doc, i):
+        paragraph = doc.add_paragraph(f"Clause {i} ")
+        bookmark = OxmlElement("w:bookmarkStart")
+        bookmark.set(qn("w:id"), str(i))
+        bookmark.set(qn("w:name"), f"clause_{i}")
+        paragraph._p.append(bookmark)
+        comment = OxmlElement("w:commentRangeStart")
+        comment.set(qn("w:id"), str(i))
+        paragraph._p.append(comment)
+        paragraph.add_run("ends here.").add_break(WD_BREAK.PAGE)
+
+    cases = []
+    for name, add in [("plain", plain), ("formatted", formatted), ("numbered", numbered), ("annotated", annotated)]:
+        doc = Document()
+        for i in range(n_paragraphs):
+            add(doc, i)
+        cases.append((name, doc))
+    return cases
+
+def xpath_paragraph_features(paragraphs):
+    # The previous extract_paragraph_block approach: one XPath query per feature
+    for paragraph in paragraphs:
+        p = paragraph._element
+        p.xpath(".//w:numPr")
+        p.xpath(".//w:br[@w:type='page']")
+        p.xpath(".//w:bookmarkStart")
+        p.xpath(".//w:commentRangeStart")
+
+def scanned_paragraph_features(paragraphs):
+    for paragraph in paragraphs:
+        app.scan_paragraph_features(paragraph._element)
+
+def extract_paragraph_blocks(paragraphs):
+    for paragraph in paragraphs:
+        app.extract_paragraph_block(paragraph)
+
+def bench_paragraphs(args):
+    print(f"Per-paragraph cost in microseconds ({args.paragraphs} paragraphs per case)")
+    print(f"  {'case':<10} {'4 xpath':>10} {'1 walk':>10} {'speedup':>8} {'full block':>11}")
+    for name, doc in build_paragraph_cases(args.paragraphs):
+        paragraphs = doc.paragraphs
+        n = len(paragraphs)
+        old_time, _ = timed(xpath_paragraph_features, paragraphs)
+        new_time, _ = timed(scanned_paragraph_features, paragraphs)
+        block_time, _ = timed(extract_paragraph_blocks, paragraphs)
+        print(f"  {name:<10} {old_time / n * 1e6:10.2f} {new_time / n * 1e6:10.2f} "
+              f"{old_time / new_time:7.1f}x {block_time / n * 1e6:11.2f}")
+
+def build_report_document(n_paragraphs):
+    """A report with headings, formatted body paragraphs and a table every 50 paragraphs."""
+    doc = Document()
+    for i in range(n_paragraphs):
+        if i % 25 == 0:
+            doc.add_heading(f"Chapter {i // 25}", level=1 + (i // 25) % 3)
+        paragraph = doc.add_paragraph(f"Paragraph {i}: ")
+        paragraph.add_run("bold term").bold = True
+        paragraph.add_run(" followed by ordinary body text for the indexer.")
+        if i % 50 == 49:
+            table = doc.add_table(rows=3, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = f"cell {i}"
+    return doc
+
+def bench_text(args):
+    path = os.path.join(tempfile.mkdtemp(), "report.docx")
+    build_report_document(args.paragraphs).save(path)
+    print(f"Document: {args.paragraphs} paragraphs, {os.path.getsize(path) // 1024} KB")
+    full_time, _ = timed(lambda: app.extract_all_sections(Document(path), tempfile.gettempdir(), "bench"))
+    stream_time, _ = timed(lambda: app.stream_extract_all_sections(path))
+    text_time, result = timed(app.extract_text, path)
+    print(f"  full, docx engine   : {full_time * 1000:8.1f} ms")
+    print(f"  full, stream engine : {stream_time * 1000:8.1f} ms")
+    print(f"  mode=text           : {text_time * 1000:8.1f} ms  ({full_time / text_time:.1f}x faster than docx engine)")
+    print(f"  {len(result['paragraphs'])} paragraphs of text")
+
+def add_split_run(paragraph, text, rsid, bold=False):
+    # A run as Word writes it while tracking edit sessions: same formatting, new rsid
+    run = paragraph.add_run(text)
+    run.bold = bold or None
+    run._r.set(qn("w:rsidR"), rsid)
+    return run
+
+def build_run_corpus(n_paragraphs):
+    """Documents whose runs are split the way revision tracking splits them."""
+    def rsid_prose(doc, i):
+        paragraph = doc.add_paragraph()
+        for j, word in enumerate(f"Clause {i} of the agreement was amended in session {i % 7}.".split()):
+            add_split_run(paragraph, word + " ", f"00{(i + j) % 9:06X}")
+
+    def mixed(doc, i):
+        paragraph = doc.add_paragraph()
+        for j in range(8):
+            # bold phrase of two split runs, then two plain split runs
+            add_split_run(paragraph, f"term {j} ", f"00A{j:05X}", bold=j % 4 < 2)
+
+    def single(doc, i):
+        doc.add_paragraph(f"Paragraph {i} was written in one editing session.")
+
+    corpus = []
+    for name, add in [("rsid-prose", rsid_prose), ("mixed", mixed), ("single-run", single)]:
+        doc = Document()
+        for i in range(n_paragraphs):
+            add(doc, i)
+        corpus.append((name, doc))
+    return corpus
+
+def count_runs(blocks):
+    total = 0
+    for block in blocks:
+        total += len(block.get("runs", []))
+        for row in block.get("rows", []):
+            for cell in row:
+                total += count_runs(cell["blocks"])
+    return total
+
+def rebuild(blocks):
+    doc = Document()
+    app.add_blocks_to_doc(doc, blocks, tempfile.gettempdir())
+    return doc
+
+def bench_runs(args):
+    corpus = build_run_corpus(args.paragraphs)
+    corpus.extend((os.path.basename(path), Document(path)) for path in args.files)
+    print(f"  {'document':<16} {'runs':>8} {'merged':>8} {'bytes':>10} {'merged':>10} {'saved':>6} {'to docx':>9} {'merged':>9}")
+    totals = [0, 0, 0, 0]
+    for name, doc in corpus:
+        split = app.extract_blocks(doc, tempfile.gettempdir(), name, {"runs": "split"})
+        merged = app.extract_blocks(doc, tempfile.gettempdir(), name, {"runs": "merged"})
+        counts = [count_runs(split), count_runs(merged)]
+        sizes = [len(json.dumps(split).encode()), len(json.dumps(merged).encode())]
+        split_time, _ = timed(rebuild, split, repeat=1)
+        merged_time, _ = timed(rebuild, merged, repeat=1)
+        print(f"  {name[:16]:<16} {counts[0]:8d} {counts[1]:8d} {sizes[0]:10d} {sizes[1]:10d} "
+              f"{1 - sizes[1] / sizes[0]:6.0%} {split_time * 1000:7.0f}ms {merged_time * 1000:7.0f}ms")
+        totals = [t + v for t, v in zip(totals, counts + sizes)]
+    print(f"  {'total':<16} {totals[0]:8d} {totals[1]:8d} {totals[2]:10d} {totals[3]:10d} {1 - totals[3] / totals[2]:6.0%}")
+
+def bench_formats(args):
+    path = os.path.join(tempfile.mkdtemp(), "report.docx")
+    build_report_document(args.paragraphs).save(path)
+    result = app.stream_extract_all_sections(path)
+    encoders = [
+        ("json indent=2", lambda d: json.dumps(d, indent=2, ensure_ascii=False).encode("utf-8"), json.loads),
+        ("json compact", lambda d: json.dumps(d, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), json.loads),
+    ]
+    if app.orjson is not None:
+        encoders.append(("orjson", app.orjson.dumps, app.orjson.loads))
+    if app.msgpack is not None:
+        encoders.append(("msgpack", lambda d: app.encode_body(d, app.MEDIA_MSGPACK), lambda b: app.decode_body(b, app.MEDIA_MSGPACK)))
+    if app.cbor2 is not None:
+        encoders.append(("cbor", lambda d: app.encode_body(d, app.MEDIA_CBOR), lambda b: app.decode_body(b, app.MEDIA_CBOR)))
+    print(f"Result of a {args.paragraphs}-paragraph report")
+    print(f"  {'format':<14} {'bytes':>10} {'encode':>10} {'decode':>10}")
+    for name, encode, decode in encoders:
+        encode_time, body = timed(encode, result)
+        decode_time, decoded = timed(decode, body)
+        assert decoded == result, f"{name} does not round-trip"
+        print(f"  {name:<14} {len(body):10d} {encode_time * 1000:8.1f}ms {decode_time * 1000:8.1f}ms")
+
+def build_write_blocks(n_paragraphs, n_runs):
+    """JSON blocks for a document of formatted paragraphs, with headings and list items."""
+    formats = [{}, {"bold": True}, {"italic": True, "font_size": 11.5}, {"font_name": "Arial", "color": "#1F497D"},
+               {"underline": True, "highlight": "YELLOW"}]
+    blocks = []
+    for i in range(n_paragraphs):
+        runs = [dict(formats[j % len(formats)], text=f"run {j}\tof paragraph {i} ") for j in range(n_runs)]
+        if i % 40 == 0:
+            blocks.append({"type": "heading", "level": 1 + (i // 40) % 3, "runs": runs[:2]})
+        elif i % 10 < 3:
+            blocks.append({"type": "list_item", "list_type": "number" if i % 2 else "bullet", "runs": runs})
+        else:
+            blocks.append({"type": "paragraph", "alignment": "center" if i % 7 == 0 else "left", "runs": runs})
+    return blocks
+
+def write_with(add_blocks, blocks):
+    doc = Document()
+    add_blocks(doc, blocks, tempfile.gettempdir())
+    return doc
+
+def bench_write(args):
+    blocks = build_write_blocks(args.paragraphs, args.runs)
+    n_runs = count_runs(blocks)
+    docx_time, docx_doc = timed(write_with, app.add_blocks_to_doc, blocks, repeat=1)
+    xml_time, xml_doc = timed(write_with, app.write_blocks_xml, blocks, repeat=1)
+    same = etree.tostring(docx_doc.element) == etree.tostring(xml_doc.element)
+    print(f"JSON -> DOCX body: {len(blocks)} blocks, {n_runs} runs")
+    print(f"  python-docx calls  : {docx_time * 1000:8.1f} ms  ({docx_time / n_runs * 1e6:.1f} us/run)")
+    print(f"  xml write engine   : {xml_time * 1000:8.1f} ms  ({xml_time / n_runs * 1e6:.1f} us/run, {docx_time / xml_time:.1f}x)")
+    print(f"  document.xml identical: {same}")
+
+def build_letterhead_json(n_tables):
+    """A short letter whose header and footer are laid out with tables, as templates often are."""
+    logo = {"type": "table", "rows": [[{"blocks": [{"type": "paragraph", "runs": [{"text": "ACME Corp"}]}]},
+                                       {"blocks": [{"type": "paragraph", "runs": [{"text": "Ref 2024-17"}]}]}]]}
+    sections = [{"header": [logo], "footer": [logo]} for _ in range(max(1, n_tables // 2))]
+    body = [{"type": "paragraph", "runs": [{"text": f"Paragraph {i} of the letter."}]} for i in range(20)]
+    return {"sections": sections, "body": body}
+
+def convert_json(path):
+    class FileLike:
+        name = path
+    return app.convert_document(FileLike(), "docx")
+
+def bench_template(args):
+    parse_time, _ = timed(Document, repeat=20)
+    clone_time, _ = timed(app.new_document, repeat=20)
+    path = os.path.join(tempfile.mkdtemp(), "letter.json")
+    with open(path, "w") as f:
+        json.dump(build_letterhead_json(args.tables), f)
+    with contextlib.redirect_stdout(io.StringIO()):
+        request_time, _ = timed(convert_json, path, repeat=10)
+    n_tables = 2 * max(1, args.tables // 2)
+    saved = parse_time - clone_time + n_tables * parse_time
+    print(f"  Document() (parse template)  : {parse_time * 1000:6.2f} ms")
+    print(f"  new_document() (copy)        : {clone_time * 1000:6.2f} ms")
+    print(f"  JSON -> DOCX, {n_tables} header/footer tables: {request_time * 1000:6.2f} ms per request")
+    print(f"  saved per request            : {saved * 1000:6.2f} ms (one template parse less, and none per table)")
+
+def fill_by_lookup(table, rows, image_dir):
+    """The previous table filling: one table.cell(i, j) lookup per cell."""
+    for i, row in enumerate(rows):
+        for j, cell in enumerate(row):
+            cell_obj = table.cell(i, j)
+            for para_block in cell["blocks"]:
+                p = cell_obj.add_paragraph()
+                for run in para_block.get("runs", []):
+                    p.add_run(run.get("text", ""))
+
+def build_table(fill, rows):
+    doc = Document()
+    table = doc.add_table(rows=len(rows), cols=len(rows[0]))
+    fill(table, rows, tempfile.gettempdir())
+    return doc
+
+def bench_tables(args):
+    sizes = []
+    n_rows = args.rows
+    while n_rows >= 10:
+        sizes.insert(0, n_rows)
+        n_rows //= 2
+    print(f"Filling an N x {args.cols} table: total ms and us per cell")
+    print(f"  {'rows':>6} {'row-wise':>16} {'cell(i, j)':>16}")
+    last_old = None
+    for n_rows in sizes:
+        rows = [[{"blocks": [{"type": "paragraph", "runs": [{"text": f"r{i}c{j}"}]}]} for j in range(args.cols)]
+                for i in range(n_rows)]
+        n_cells = n_rows * args.cols
+        new_time, new_doc = timed(build_table, app.fill_table, rows, repeat=1)
+        line = f"  {n_rows:6d} {new_time * 1000:9.0f} {new_time / n_cells * 1e6:6.1f}"
+        # The lookup version is quadratic in the number of cells, so it is only run
+        # while its projected time stays within the budget
+        if last_old is None or last_old[1] * (n_rows / last_old[0]) ** 2 <= args.baseline_budget:
+            old_time, old_doc = timed(build_table, fill_by_lookup, rows, repeat=1)
+            assert etree.tostring(old_doc.element) == etree.tostring(new_doc.element)
+            last_old = (n_rows, old_time)
+            line += f" {old_time * 1000:9.0f} {old_time / n_cells * 1e6:6.1f}"
+        else:
+            line += f" {'-':>16}"
+        print(line)
+
+def add_runs_with_setters(paragraph, runs):
+    """The previous add_runs_to_paragraph: every property setter on every run."""
+    for run_info in runs:
+        run = paragraph.add_run(run_info.get("text", ""))
+        app.apply_run_formatting(run, run_info)
+
+def add_runs_timed(add_runs, runs):
+    doc = Document()
+    paragraph = doc.add_paragraph()
+    add_runs(paragraph, runs)
+    return doc
+
+def bench_rpr(args):
+    attributes = [("bold", True), ("italic", True), ("font_size", 10.5), ("font_name", "Georgia"),
+                  ("color", "#1F497D"), ("highlight", "YELLOW"), ("underline", True), ("small_caps", True)]
+    print(f"{args.runs} runs per case, us per run")
+    print(f"  {'attributes':>10} {'setters':>9} {'templates':>10} {'speedup':>8}")
+    for n in range(0, len(attributes) + 1, 2):
+        runs = [dict(attributes[:n], text=f"word{i} ") for i in range(args.runs)]
+        old_time, old_doc = timed(add_runs_timed, add_runs_with_setters, runs, repeat=1)
+        new_time, new_doc = timed(add_runs_timed, app.add_runs_to_paragraph, runs, repeat=1)
+        assert etree.tostring(old_doc.element) == etree.tostring(new_doc.element)
+        print(f"  {n:10d} {old_time / args.runs * 1e6:9.1f} {new_time / args.runs * 1e6:10.1f} {old_time / new_time:7.1f}x")
+
+def ingest_buffered(path, engine):
+    """The previous API path: the body held as bytes and as objects, re-encoded, then loaded whole again."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = app.decode_body(raw, app.MEDIA_JSON)
+    with open(path + ".copy.json", "wb") as f:
+        f.write(app.encode_json(data))
+    del raw, data
+    ijson, app.ijson = app.ijson, None
+    try:
+        app.convert_document(path + ".copy.json", "docx", engine)
+    finally:
+        app.ijson = ijson
+
+def ingest_streamed(path, engine):
+    with open(path, "rb") as f:
+        doc = app.stream_json_document(f, os.path.dirname(path), engine)
+    doc.save(io.BytesIO())
+
+def peak_memory(func, *args):
+    """Seconds taken and peak Python heap, in bytes, of func(*args)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def bench_ingest(args):
+    if app.ijson is None:
+        print("ijson is not installed; JSON -> DOCX always loads the whole body")
+        return
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, "document.json")
+    with open(path, "w") as f:
+        json.dump({"sections": [{}], "body": build_write_blocks(args.paragraphs, 10)}, f)
+    size = os.path.getsize(path)
+    buffered_time, buffered_peak = peak_memory(ingest_buffered, path, args.engine)
+    stream_time, stream_peak = peak_memory(ingest_streamed, path, args.engine)
+    print(f"JSON -> DOCX ingestion of a {size / 2**20:.1f} MB body, {args.engine} engine (peak Python heap; lxml trees not included)")
+    print(f"  buffered  : {buffered_time:6.2f} s  peak {buffered_peak / 2**20:7.1f} MB")
+    print(f"  streamed  : {stream_time:6.2f} s  peak {stream_peak / 2**20:7.1f} MB")
+
+def pipeline_on_disk(data, engine):
+    """The previous API path: JSON written to a temp dir, the DOCX saved there and re-opened to count."""
+    path = os.path.join(tempfile.mkdtemp(), "document.json")
+    with open(path, "wb") as f:
+        f.write(app.encode_json(data))
+    _, _, docx_path = app.convert_document(path, "docx", engine)
+    doc = Document(docx_path)
+    counts = len(doc.paragraphs), len(doc.tables)
+    with open(docx_path, "rb") as f:
+        return f.read(), counts
+
+def pipeline_in_memory(data, engine):
+    doc = app.json_to_document(data, app.IMAGE_STORE_DIR, engine)
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue(), app.document_counts(doc)
+
+def bench_pipeline(args):
+    data = build_letterhead_json(4)
+    data["body"] += build_write_blocks(args.paragraphs, 5)
+    with contextlib.redirect_stdout(io.StringIO()):
+        disk_time, (_, disk_counts) = timed(pipeline_on_disk, copy.deepcopy(data), args.engine, repeat=10)
+        memory_time, (_, memory_counts) = timed(pipeline_in_memory, copy.deepcopy(data), args.engine, repeat=10)
+    assert disk_counts == memory_counts
+    print(f"JSON -> DOCX request, {len(data['body'])} body blocks, {args.engine} engine")
+    print(f"  temp files + re-open : {disk_time * 1000:7.1f} ms")
+    print(f"  in memory            : {memory_time * 1000:7.1f} ms  ({disk_time / memory_time:.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DOCX <-> JSON conversion paths")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    hyperlinks = subparsers.add_parser("hyperlinks", help="Hyperlink resolution for runs")
+    hyperlinks.add_argument("--links", type=int, default=10000, help="Number of hyperlinks in the document")
+    hyperlinks.set_defaults(func=bench_hyperlinks)
+
+    paragraphs = subparsers.add_parser("paragraphs", help="Paragraph-level feature detection")
+    paragraphs.add_argument("--paragraphs", type=int, default=2000, help="Number of paragraphs per case")
+    paragraphs.set_defaults(func=bench_paragraphs)
+
+    text = subparsers.add_parser("text", help="mode=text extraction against full extraction")
+    text.add_argument("--paragraphs", type=int, default=5000, help="Number of body paragraphs")
+    text.set_defaults(func=bench_text)
+
+    runs = subparsers.add_parser("runs", help="Run coalescing: runs and JSON bytes with and without merging")
+    runs.add_argument("--paragraphs", type=int, default=1000, help="Number of paragraphs per generated document")
+    runs.add_argument("files", nargs="*", help="Additional .docx files to include in the corpus")
+    runs.set_defaults(func=bench_runs)
+
+    formats = subparsers.add_parser("formats", help="Size and encode/decode cost of the response formats")
+    formats.add_argument("--paragraphs", type=int, default=3000, help="Number of body paragraphs")
+    formats.set_defaults(func=bench_formats)
+
+    write = subparsers.add_parser("write", help="JSON -> DOCX with python-docx calls against the xml write engine")
+    write.add_argument("--paragraphs", type=int, default=5000, help="Number of body blocks")
+    write.add_argument("--runs", type=int, default=10, help="Formatted runs per paragraph")
+    write.set_defaults(func=bench_write)
+
+    template = subparsers.add_parser("template", help="Default template parse against copy, per JSON -> DOCX request")
+    template.add_argument("--tables", type=int, default=4, help="Header/footer tables in the generated letter")
+    template.set_defaults(func=bench_template)
+
+    tables = subparsers.add_parser("tables", help="Table filling: table.cell(i, j) lookups against the row-wise builder")
+    tables.add_argument("--rows", type=int, default=2000, help="Rows in the largest table; halved down to 10")
+    tables.add_argument("--cols", type=int, default=20, help="Columns per table")
+    tables.add_argument("--baseline-budget", type=float, default=10.0, help="Seconds the cell(i, j) baseline may take per size")
+    tables.set_defaults(func=bench_tables)
+
+    rpr = subparsers.add_parser("rpr", help="Run formatting: property setters against cloned w:rPr templates")
+    rpr.add_argument("--runs", type=int, default=20000, help="Runs per formatting case")
+    rpr.set_defaults(func=bench_rpr)
+
+    ingest = subparsers.add_parser("ingest", help="JSON -> DOCX peak memory: whole-body decode against streamed parsing")
+    ingest.add_argument("--paragraphs", type=int, default=20000, help="Number of body blocks, 10 runs each")
+    ingest.add_argument("--engine", choices=app.WRITE_ENGINES, default="xml", help="Write engine for both paths")
+    ingest.set_defaults(func=bench_ingest)
+
+    pipeline = subparsers.add_parser("pipeline", help="JSON -> DOCX request: temp-file round trips against the in-memory build")
+    pipeline.add_argument("--paragraphs", type=int, default=50, help="Body paragraphs after the letter")
+    pipeline.add_argument("--engine", choices=app.WRITE_ENGINES, default="xml", help="Write engine for both paths")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()